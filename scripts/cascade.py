@@ -0,0 +1,120 @@
+"""
+cascade
+-------
+Cheap local relevance filter in front of the LLM.
+
+A hashing-vectorizer + logistic regression model, trained on articles already
+classified by the LLM (e.g. sentiment_classification_prelim.csv), scores how
+likely an article is to be relevant (final stance A, B or C rather than D).
+Articles scoring below `skip_below` are labeled D locally; everything else is
+sent to SentimentClassifier as before. CPU only, no network.
+
+agreement_report() holds out part of the labeled data and reports, for a range
+of thresholds, how much LLM traffic is skipped and how often the cascade's
+final stance agrees with the LLM-only stance.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import LogisticRegression
+
+from stance import STANCE_COLS, get_stance
+
+
+class RelevanceFilter:
+    def __init__(self, skip_below: float = 0.15, n_features: int = 2 ** 18, C: float = 4.0):
+        self.skip_below = skip_below
+        # Stateless vectorizer: nothing to fit or persist besides the linear model
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features,
+            ngram_range=(1, 2),
+            stop_words="english",
+            alternate_sign=False,
+            norm="l2",
+        )
+        self.model = LogisticRegression(C=C, class_weight="balanced", max_iter=2000)
+
+    @staticmethod
+    def labels_from_counts(counts: np.ndarray):
+        # relevant = final stance is not D; weight = share of votes behind that call
+        stance = get_stance(counts)
+        relevant = (stance != "D").astype(int)
+        total = np.maximum(counts.sum(axis=1), 1)
+        d_share = counts[:, 3] / total
+        weight = np.where(relevant == 1, 1 - d_share, d_share)
+        return relevant, np.maximum(weight, 0.2)
+
+    def fit(self, texts: Iterable[str], counts: np.ndarray) -> "RelevanceFilter":
+        relevant, weight = self.labels_from_counts(np.asarray(counts))
+        X = self.vectorizer.transform(pd.Series(list(texts)).fillna(""))
+        self.model.fit(X, relevant, sample_weight=weight)
+        return self
+
+    @classmethod
+    def from_classifications(cls, csv_path: str, **kwargs) -> "RelevanceFilter":
+        df = pd.read_csv(csv_path)
+        return cls(**kwargs).fit(df["text"], df[STANCE_COLS].to_numpy())
+
+    def predict_proba(self, texts: Iterable[str]) -> np.ndarray:
+        X = self.vectorizer.transform(pd.Series(list(texts)).fillna(""))
+        return self.model.predict_proba(X)[:, 1]
+
+    def needs_llm(self, texts: Iterable[str], skip_below: Optional[float] = None) -> np.ndarray:
+        threshold = self.skip_below if skip_below is None else skip_below
+        return self.predict_proba(texts) >= threshold
+
+    @staticmethod
+    def local_votes(n_templates: int) -> dict:
+        # Vote counts recorded for a skipped article: every template says D
+        return {"stanceA": 0, "stanceB": 0, "stanceC": 0, "stanceD": n_templates}
+
+
+def agreement_report(
+    df: pd.DataFrame,
+    thresholds: Sequence[float] = (0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5),
+    test_size: float = 0.3,
+    seed: int = 234,
+    **kwargs,
+) -> pd.DataFrame:
+    """
+    Train on part of a classified dataset and compare cascade vs. LLM-only stances
+    on the rest. Split is stratified by `strata` when the column is present.
+    """
+    rng = np.random.default_rng(seed)
+    groups = df.groupby("strata").indices if "strata" in df.columns else {0: np.arange(len(df))}
+    test_idx = np.concatenate([
+        rng.choice(idx, size=int(round(len(idx) * test_size)), replace=False) for idx in groups.values()
+    ])
+    is_test = np.zeros(len(df), dtype=bool)
+    is_test[test_idx] = True
+    train, test = df.loc[~is_test], df.loc[is_test]
+
+    filt = RelevanceFilter(**kwargs).fit(train["text"], train[STANCE_COLS].to_numpy())
+    p = filt.predict_proba(test["text"])
+    llm_stance = get_stance(test[STANCE_COLS].to_numpy())
+    relevant = llm_stance != "D"
+
+    rows = []
+    for t in thresholds:
+        skipped = p < t
+        cascade_stance = np.where(skipped, "D", llm_stance)
+        rows.append({
+            "skip_below": t,
+            "n_test": len(test),
+            "llm_share": 1 - skipped.mean(),
+            "agreement": (cascade_stance == llm_stance).mean(),
+            "relevant_recall": (~skipped[relevant]).mean() if relevant.any() else np.nan,
+        })
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    prelim = pd.read_csv("data/sentiment_classification_prelim.csv")
+    report = agreement_report(prelim)
+    print(report.to_string(index=False))
+    report.to_csv("data/cascade_agreement.csv", index=False)
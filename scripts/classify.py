@@ -7,55 +7,121 @@ import re, os, time
 import pandas as pd
 import json
 
-from google import genai
-from google.genai import types
-from google.genai.errors import ClientError
 from tqdm import tqdm
 
-from extract import extract_article_text
-from prompts import get_prompts
+from prompts import get_prompts, get_shared_prompt
+from ratelimit import RateLedger, estimate_tokens
+from telemetry import CallRecord, Telemetry
 
 models = [
     "gemma-3-4b-it",
     "gemma-3n-e4b-it"
 ]
 
-with open("gemma-api-key.txt", "r") as f:
-    API_KEY = f.read().strip()
+def load_api_key(path: str = "gemma-api-key.txt") -> str:
+    # Read only when classification actually runs, never at import time
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return f.read().strip()
+    key = os.environ.get("GEMINI_API_KEY")
+    if not key:
+        raise RuntimeError(f"Missing API key: create {path} or set GEMINI_API_KEY")
+    return key
 
 class SentimentClassifier:
-    def __init__(self, api_key: Optional[str] = None, model: str = "gemma-3-4b-it", prompts: str = "health vs. economy"):
-        self.client = genai.Client(api_key=api_key)
+    def __init__(self, api_key: Optional[str] = None, model: str = "gemma-3-4b-it", prompts: str = "health vs. economy",
+                 ledger: Optional[RateLedger] = None, client=None):
+        # client: anything with client.models.generate_content(model=, contents=, config=),
+        # e.g. shared_context.LocalBackend for offline runs; defaults to google-genai
+        if client is None:
+            # google-genai is slow to import; only pay for it when a classifier is built
+            from google import genai
+            client = genai.Client(api_key=api_key)
+        self.client = client
         if not self.client:
             raise RuntimeError("Missing API key: set GEMINI_API_KEY or pass explicitly")
         self.model = model
         self.schema = {"type": "STRING", "enum": ["A", "B", "C", "D"]}
-        self.config = types.GenerateContentConfig(temperature=0, response_schema=self.schema)
+        # Plain dict: google-genai accepts it in place of types.GenerateContentConfig
+        self.config = {"temperature": 0, "response_schema": self.schema}
+        # The multi-question prompt answers in "<n>: <label>" lines, so no single-label schema
+        self.shared_config = {"temperature": 0}
 
         self.prompt_templates = get_prompts(prompts)
+        self.shared_template = get_shared_prompt(prompts)
+
+        # Quota is per API key, so every classifier on this host paces through one shared ledger
+        self.ledger = ledger if ledger is not None else RateLedger(api_key)
+        self.telemetry = Telemetry()
 
     def build_prompt(self, topic: str, content: str, prompt_num: int) -> str:
         return self.prompt_templates[prompt_num].format(topic=topic, content=content)
 
-    def classify(self, topic: str, article_text: str, prompt_num: int) -> Dict[str, str]:
-        prompt = self.build_prompt(topic, article_text, prompt_num)
+    def build_shared_prompt(self, topic: str, content: str) -> str:
+        return self.shared_template.format(topic=topic, content=content)
+
+    def _generate(self, prompt: str, config, template: Optional[int]) -> Tuple[str, CallRecord]:
+        try:
+            from google.genai.errors import ClientError
+        except ImportError:  # local backend without google-genai installed
+            ClientError = ()
+
+        est_tokens = estimate_tokens(prompt)
+        record = CallRecord(model=self.model, template=template)
 
         output_text = ""
         while not output_text.strip():
+            record.backoff_sec += self.ledger.acquire(est_tokens)
+            start = time.perf_counter()
             try:
-                output_text = self.client.models.generate_content(
+                response = self.client.models.generate_content(
                     model=self.model,
                     contents=prompt,
-                    config=self.config,
-                ).text
+                    config=config,
+                )
             except ClientError as e:
+                record.retries += 1
                 retry_delay = e.details['error']['details'][-1]['retryDelay']
-                print("retryDelay =", retry_delay)
                 if retry_delay and retry_delay.endswith("s"):
-                    time.sleep(float(retry_delay[:-1]))
+                    # Hold back every process sharing this key, not just this one
+                    self.ledger.block(float(retry_delay[:-1]))
+                continue
+            record.latency_sec = time.perf_counter() - start
+            output_text = response.text or ""
+            if not output_text.strip():
+                record.retries += 1
                 continue
+            usage = getattr(response, "usage_metadata", None)
+            if usage is not None and usage.total_token_count:
+                self.ledger.record_usage(est_tokens, usage.total_token_count)
+                record.input_tokens = usage.prompt_token_count or 0
+                record.output_tokens = usage.candidates_token_count or usage.total_token_count - record.input_tokens
+            else:
+                record.input_tokens, record.output_tokens = est_tokens, estimate_tokens(output_text)
+                record.estimated = True
+        return output_text, record
+
+    @property
+    def usage(self) -> Dict[str, int]:
+        df = self.telemetry.frame()
+        return {"calls": len(df), "tokens": int(df["total_tokens"].sum())}
 
-        return self.extract_label(output_text)
+    def classify(self, topic: str, article_text: str, prompt_num: int) -> Dict[str, str]:
+        prompt = self.build_prompt(topic, article_text, prompt_num)
+        output_text, record = self._generate(prompt, self.config, prompt_num)
+        result = self.extract_label(output_text)
+        record.parse_failures = int(result["label"] is None)
+        self.telemetry.add(record)
+        return result
+
+    def classify_shared(self, topic: str, article_text: str) -> List[Optional[str]]:
+        """All templates in one call over a single copy of the article; one label per template."""
+        prompt = self.build_shared_prompt(topic, article_text)
+        output_text, record = self._generate(prompt, self.shared_config, None)
+        labels = self.extract_labels(output_text, len(self.prompt_templates))
+        record.parse_failures = labels.count(None)
+        self.telemetry.add(record)
+        return labels
 
     @staticmethod
     def extract_label(output_text):
@@ -68,6 +134,36 @@ class SentimentClassifier:
         label = match.group(0) if match else None
         return {"label": label}
 
+    @staticmethod
+    def extract_labels(output_text: str, n: int) -> List[Optional[str]]:
+        # "<n>: <label>" lines from a shared prompt; questions without an answer stay None
+        labels: List[Optional[str]] = [None] * n
+        for num, label in re.findall(r"(?m)^\W*(?:question\s*)?(\d+)\W*?[:.)=-]\s*\**\s*([A-D])\b", output_text, flags=re.I):
+            i = int(num) - 1
+            if 0 <= i < n and labels[i] is None:
+                labels[i] = label.upper()
+        return labels
+
+def classify_article(clf: SentimentClassifier, article_text: str, topic: str = "vaccination", sleep_sec: float = 0,
+                     shared: bool = False) -> Dict[str, int]:
+    # One call per prompt template; returns the stanceA-stanceD vote counts.
+    # Pacing comes from clf.ledger, so no fixed sleep is needed between calls.
+    # shared=True asks every template in one call and re-asks only the templates
+    # whose answer could not be parsed, so the vote columns stay complete
+    if shared:
+        stances = clf.classify_shared(topic, article_text)
+        for prompt_num, label in enumerate(stances):
+            if label is None:
+                stances[prompt_num] = clf.classify(topic, article_text, prompt_num=prompt_num)["label"]
+    else:
+        stances = []
+        for prompt_num in range(len(clf.prompt_templates)):
+            result = clf.classify(topic, article_text, prompt_num=prompt_num)
+            stances.append(result["label"])
+            time.sleep(sleep_sec)
+    clf.telemetry.n_articles += 1
+    return {f"stance{label}": stances.count(label) for label in "ABCD"}
+
 ksl_articles = [
     "https://www.ksl.com/article/50131978/experts-sound-warning-as-utah-student-vaccination-rates-show-troubling-trend",
     "https://www.ksl.com/article/50391394/childhood-vaccination-rates-fell-in-kindergartners-last-school-year-cdc-data-shows",
@@ -86,9 +182,34 @@ deseret_articles = [
 
 test_urls = ksl_articles + deseret_articles
 
-if __name__ == "__main__":
+def classify_sample(
+    sample_csv: str = "data/main_sample.csv",
+    out_csv: str = "data/sentiment_classification_main.csv",
+    *,
+    model: str = models[1],
+    api_key: Optional[str] = None,
+    framing: str = "health vs. economy",
+    skip_below: Optional[float] = None,
+    shared: bool = False,
+    cube_path: Optional[str] = "data/stance_cube.sqlite",
+    telemetry_path: Optional[str] = "data/llm_telemetry",
+    frame_csv: str = "data/sampling_frame.csv",
+    strata: Optional[List[int]] = None,
+) -> pd.DataFrame:
+    sample = pd.read_csv(sample_csv)
 
-    sample = pd.read_csv("data/main_sample.csv")
+    # After a delta crawl (collect --delta) only the affected strata are re-classified;
+    # rows of other strata that the last run already classified keep their votes
+    previous = None
+    if strata is not None and os.path.exists(out_csv):
+        from strata import assign_strata
+        if "strata" not in sample.columns:
+            sample = assign_strata(sample)
+        previous = pd.read_csv(out_csv)
+        redo = sample["strata"].isin(list(strata)) | ~sample["url"].isin(previous["url"])
+        previous = previous.loc[previous["url"].isin(sample.loc[~redo, "url"])]
+        sample = sample.loc[redo].reset_index(drop=True)
+        print(f"Re-classifying {len(sample)} articles in strata {sorted(strata)}, keeping {len(previous)}")
 
     sentiment_data = {
         "model": [],
@@ -98,25 +219,50 @@ if __name__ == "__main__":
         "stanceD": []
     }
 
-    clf = SentimentClassifier(model=models[1], api_key=API_KEY)
+    clf = SentimentClassifier(model=model, api_key=api_key or load_api_key(), prompts=framing)
+
+    # Local relevance cascade (cascade.py): articles it is confident are unrelated
+    # are recorded as all-D votes without calling the LLM. None disables it.
+    needs_llm = [True] * len(sample)
+    if skip_below is not None:
+        from cascade import RelevanceFilter
+        relevance = RelevanceFilter.from_classifications("data/sentiment_classification_prelim.csv", skip_below=skip_below)
+        needs_llm = relevance.needs_llm(sample["text"])
+        print(f"Relevance cascade sends {needs_llm.mean():.1%} of articles to the LLM")
+
     for i in tqdm(range(len(sample["url"])), desc="Classifying articles"):
         test_url = sample.loc[i, "url"]
         article_text = sample.loc[sample['url'] == test_url, 'text'].iat[0] #extract_article_text(test_url)
-        stances = []
-        for prompt_num in range(len(clf.prompt_templates)):
-            result = clf.classify("vaccination", article_text, prompt_num=prompt_num)
-            stances.append(result["label"])
-            time.sleep(3)
-
-        sentiment_data["stanceA"].append(stances.count("A"))
-        sentiment_data["stanceB"].append(stances.count("B"))
-        sentiment_data["stanceC"].append(stances.count("C"))
-        sentiment_data["stanceD"].append(stances.count("D"))
-
-        sentiment_data["model"].append(models[1])
+        if needs_llm[i]:
+            counts = classify_article(clf, article_text, shared=shared)
+            sentiment_data["model"].append(model)
+        else:
+            counts = RelevanceFilter.local_votes(len(clf.prompt_templates))
+            sentiment_data["model"].append("relevance-cascade")
+        for col, n in counts.items():
+            sentiment_data[col].append(n)
 
     sentiment_data = pd.DataFrame(sentiment_data)
     sentiment_data = pd.concat([sample, sentiment_data], axis=1)
     print(sentiment_data.head())
 
-    sentiment_data.to_csv("data/sentiment_classification_main.csv", index=False)
\ No newline at end of file
+    output = sentiment_data if previous is None else pd.concat([previous, sentiment_data], ignore_index=True)
+    output.to_csv(out_csv, index=False)
+
+    # Per-call tokens, latency and retries (telemetry.py), projected to the full frame
+    if telemetry_path and clf.telemetry.n_articles:
+        clf.telemetry.print_report()
+        projection = None
+        if os.path.exists(frame_csv):
+            projection = clf.telemetry.projection(len(pd.read_csv(frame_csv, usecols=["url"])))
+            print(f"Full frame projection: {projection}")
+        clf.telemetry.save(telemetry_path, projection=projection)
+
+    # Keep the monthly site x stratum aggregates (cube.py) current
+    if cube_path:
+        from cube import StanceCube
+        StanceCube(cube_path).add_classifications(sentiment_data, model=model, framing=framing)
+    return output
+
+if __name__ == "__main__":
+    classify_sample("data/main_sample.csv", "data/sentiment_classification_main.csv", model=models[1])
@@ -0,0 +1,200 @@
+"""
+Single entry point for the pipeline.
+
+    python scripts/cli.py harvest   [--domains deseretnews ksl] [--discovered data/discovered_sitemaps.json]
+    python scripts/cli.py collect   [--domains ksl] [--urlstart N] [--delta]
+    python scripts/cli.py refilter  [--keywords booster mRNA "herd immunity"]
+    python scripts/cli.py frame     [--json data/vaccine_articles_1.json data/vaccine_articles.json]
+    python scripts/cli.py sample
+    python scripts/cli.py classify  [--model gemma-3n-e4b-it] [--skip-below 0.15] [--shared]
+                                    [--strata-file data/affected_strata.json]
+    python scripts/cli.py run       [--only classify model] [--force sample] [--dry-run]
+
+Only argparse is imported up front. Each subcommand imports the modules it
+needs (trafilatura, bs4, google-genai, ...) when it runs, and the API key is
+read by the classify subcommand only.
+"""
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+SCRIPTS = Path(__file__).resolve().parent
+
+
+def cmd_harvest(args):
+    sys.path.insert(0, str(SCRIPTS / "sources"))
+    from harvest import SitemapParser
+
+    if args.discovered:
+        parser = SitemapParser.from_discovered(args.discovered, domains=args.domains)
+    else:
+        parser = SitemapParser(args.domains or ["deseretnews", "ksl"])
+    data = parser.parse()
+    for domain, urls in data.items():
+        print(f"{domain}: {len(urls)} URLs")
+    parser.export_json(args.out)
+    parser.export_lastmod(args.lastmod_out)
+
+
+def cmd_collect(args):
+    from cube import StanceCube
+    from sample_frame import DEFAULT_KEY_WORDS, VaccineArticleCollector
+    from textstore import TextStore
+
+    collector = VaccineArticleCollector(
+        json_in=args.json_in,
+        json_out=args.json_out,
+        start_date=args.start_date,
+        end_date=args.end_date,
+        keywords=DEFAULT_KEY_WORDS,
+        decided_path=args.decided,
+        text_store=TextStore(args.text_store) if args.text_store else None,
+        cube=StanceCube(args.cube) if args.cube else None,
+    )
+    if args.delta:
+        collector.process_delta(lastmod_json=args.lastmod, domains=args.domains)
+    else:
+        collector.process(domains=args.domains, urlstart=args.urlstart)
+    collector.save()
+    if args.delta:
+        import json
+
+        affected = collector.affected_strata()
+        with open(args.affected_out, "w", encoding="utf-8") as f:
+            json.dump(affected, f)
+        print(f"Affected strata: {affected} -> {args.affected_out}")
+
+
+def cmd_refilter(args):
+    import json
+
+    from sample_frame import DEFAULT_KEY_WORDS
+    from textstore import TextStore
+
+    store = TextStore(args.store)
+    keywords = args.keywords if args.only else DEFAULT_KEY_WORDS + args.keywords
+    found = store.refilter(keywords, args.start_date, args.end_date)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(found, f, ensure_ascii=False, indent=2)
+    print(f"{len(found)} of {len(store)} stored articles match -> {args.out}")
+
+
+def cmd_frame(args):
+    from collect import get_sampling_frame
+
+    sampling_frame = get_sampling_frame(args.json)
+    sampling_frame.to_csv(args.out, index=False)
+    print(f"Wrote {len(sampling_frame)} rows to {args.out}")
+
+
+def cmd_sample(args):
+    # Sampling design and allocation live in R
+    subprocess.run(["Rscript", args.script], check=True)
+
+
+def cmd_classify(args):
+    import json
+
+    from classify import classify_sample, load_api_key
+
+    strata = None
+    if args.strata_file:
+        with open(args.strata_file, encoding="utf-8") as f:
+            strata = json.load(f)
+    classify_sample(
+        args.sample,
+        args.out,
+        model=args.model,
+        api_key=load_api_key(args.key_file),
+        framing=args.framing,
+        skip_below=args.skip_below,
+        shared=args.shared,
+        strata=strata,
+    )
+
+
+def cmd_run(args):
+    from pipeline import Pipeline
+
+    status = Pipeline().run(only=args.only, force=args.force, jobs=args.jobs, dry_run=args.dry_run)
+    print(status)
+    if "failed" in status.values():
+        sys.exit(1)
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(prog="cli.py", description="Utah vaccine rhetoric pipeline")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("harvest", help="fetch sitemap URLs")
+    p.add_argument("--domains", nargs="*")
+    p.add_argument("--discovered", help="JSON written by sources/discover.py")
+    p.add_argument("--out", default="data/sitemaps.json")
+    p.add_argument("--lastmod-out", default="data/sitemap_lastmod.json")
+    p.set_defaults(func=cmd_harvest)
+
+    p = sub.add_parser("collect", help="scrape sitemap URLs into vaccine articles")
+    p.add_argument("--json-in", default="data/sitemaps.json")
+    p.add_argument("--json-out", default="data/vaccine_articles.json")
+    p.add_argument("--domains", nargs="*")
+    p.add_argument("--urlstart", type=int)
+    p.add_argument("--start-date", default="2017-01-01")
+    p.add_argument("--end-date", default="2024-01-01")
+    p.add_argument("--delta", action="store_true", help="only new or changed URLs")
+    p.add_argument("--decided", default="data/seen_urls.sqlite")
+    p.add_argument("--lastmod", default="data/sitemap_lastmod.json")
+    p.add_argument("--text-store", default="data/textstore", help="keep every extracted article ('' to disable)")
+    p.add_argument("--affected-out", default="data/affected_strata.json", help="strata touched by a --delta run")
+    p.add_argument("--cube", default="data/stance_cube.sqlite", help="monthly aggregates, cube.py ('' to disable)")
+    p.set_defaults(func=cmd_collect)
+
+    p = sub.add_parser("refilter", help="re-apply keywords / dates to the text store, offline")
+    p.add_argument("--store", default="data/textstore")
+    p.add_argument("--keywords", nargs="*", default=[], help="added to the default keyword list")
+    p.add_argument("--only", action="store_true", help="use --keywords alone")
+    p.add_argument("--start-date", default="2017-01-01")
+    p.add_argument("--end-date", default="2024-01-01")
+    p.add_argument("--out", default="data/vaccine_articles_refilter.json")
+    p.set_defaults(func=cmd_refilter)
+
+    p = sub.add_parser("frame", help="build the sampling frame CSV")
+    p.add_argument("--json", nargs="+", default=["data/vaccine_articles_1.json", "data/vaccine_articles.json"])
+    p.add_argument("--out", default="data/sampling_frame.csv")
+    p.set_defaults(func=cmd_frame)
+
+    p = sub.add_parser("sample", help="draw the stratified samples (R)")
+    p.add_argument("--script", default=str(SCRIPTS / "sample_allocation.R"))
+    p.set_defaults(func=cmd_sample)
+
+    p = sub.add_parser("classify", help="classify the main sample with the LLM")
+    p.add_argument("--sample", default="data/main_sample.csv")
+    p.add_argument("--out", default="data/sentiment_classification_main.csv")
+    p.add_argument("--model", default="gemma-3n-e4b-it")
+    p.add_argument("--framing", default="health vs. economy")
+    p.add_argument("--key-file", default="gemma-api-key.txt")
+    p.add_argument("--skip-below", type=float, help="relevance cascade threshold (cascade.py)")
+    p.add_argument("--shared", action="store_true", help="ask all templates in one call per article")
+    p.add_argument("--strata-file", help="JSON list of strata (collect --delta); other strata keep their --out rows")
+    p.set_defaults(func=cmd_classify)
+
+    p = sub.add_parser("run", help="run every stale stage (pipeline.py)")
+    p.add_argument("--only", nargs="+", help="run just these stages")
+    p.add_argument("--force", nargs="+", default=[], help="re-run these stages even if up to date")
+    p.add_argument("--jobs", type=int, default=4)
+    p.add_argument("--dry-run", action="store_true")
+    p.set_defaults(func=cmd_run)
+
+    return ap
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if str(SCRIPTS) not in sys.path:
+        sys.path.insert(0, str(SCRIPTS))
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ import pandas as pd
 import json
 
 from sampleurl import plot_articles_by_month
+from strata import assign_strata, parse_dates
+from urlnorm import canonicalize_url
 
 #Read in sampling frame of URLs
 def get_sampling_frame(json_files) -> pd.DataFrame:
@@ -22,21 +24,40 @@ def get_sampling_frame(json_files) -> pd.DataFrame:
             "text": details.get("text", "")
         })
     df = pd.DataFrame(records)
+    #Same article under several URL forms (www, trailing slash, tracking params, AMP)
+    df = df.loc[~df["url"].map(canonicalize_url).duplicated()].reset_index(drop=True)
 
     #[1188, 1282, 1284, 1287, 1290, 1292, 1295, 1297, 1298]
 
-    #First convert dates like these: '2017-10-03'
-    date1 = pd.to_datetime(df['published_time'], format='%Y-%m-%d', errors='coerce')
-    #Then convert dates like these: '2017-01-10T22:57:22Z'
-    date2 = pd.to_datetime(df['published_time'], format='%Y-%m-%dT%H:%M:%SZ', errors='coerce')
-    #and '2021-01-28T22:37:36.059Z'
-    date3 = pd.to_datetime(df['published_time'], format='%Y-%m-%dT%H:%M:%S.%fZ', errors='coerce')
-    df['date'] = date1.combine_first(date2).combine_first(date3)
+    #Dates like '2017-10-03', '2017-01-10T22:57:22Z', '2021-01-28T22:37:36.059Z' and
+    #'2021-06-10T12:00:00-06:00'; the local date as written (same as assign_strata)
+    df['date'] = parse_dates(df['published_time'])
 
-    return df
+    return sort_frame(df)
+
+#Rows grouped by stratum, then by date (articles outside the design last): prop.sample
+#in sample_allocation.R draws each stratum from one contiguous block of rows
+def sort_frame(df):
+    key = pd.DataFrame({"strata": assign_strata(df)["strata"], "date": parse_dates(df["date"])}, index=df.index)
+    order = key.sort_values(["strata", "date"], na_position="last", kind="mergesort").index
+    return df.loc[order].reset_index(drop=True)
+
+#Append articles from a delta crawl to an existing sampling frame
+def append_to_sampling_frame(frame_csv, json_files):
+    frame = pd.read_csv(frame_csv)
+    new = get_sampling_frame(json_files)
+    new = new.loc[~new["url"].map(canonicalize_url).isin(frame["url"].map(canonicalize_url))]
+    affected = assign_strata(new)["strata"].dropna().unique()
+
+    frame = sort_frame(pd.concat([frame, new], ignore_index=True))
+    return frame, sorted(int(h) for h in affected)
 
 if __name__ == "__main__":
     sampling_frame = get_sampling_frame(["data/vaccine_articles_1.json", "data/vaccine_articles.json"])
     #plot_articles_by_month(sampling_frame)
 
-    sampling_frame.to_csv("data/sampling_frame.csv", index=False)
\ No newline at end of file
+    sampling_frame.to_csv("data/sampling_frame.csv", index=False)
+
+    #After a delta crawl (cli.py collect --delta) only the new rows are added; the strata
+    #they fall in go to data/affected_strata.json for cli.py classify --strata-file
+    # sampling_frame, affected = append_to_sampling_frame("data/sampling_frame.csv", ["data/vaccine_articles.json"])
\ No newline at end of file
@@ -0,0 +1,213 @@
+"""
+cube
+----
+Materialized monthly aggregate table of coverage and stance, keyed by
+(site, month, stratum, model, framing), kept in a small SQLite file.
+
+Each cell holds
+    n_articles               articles collected
+    n_classified             articles classified
+    stanceA..stanceD         summed template votes (same names as classify.py output)
+    nA..nD                   articles whose final stance (get.stance) is A..D
+
+Coverage (n_articles) is counted in the rows with model = '' and framing = '';
+classification counts in the rows of the model and prompt framing that
+produced them, so runs with different models or framings are never summed
+together.
+
+The cube is updated incrementally. An `articles` table remembers which URLs
+(by URL only, no text) have already been counted as collected, and a
+`classifications` table holds each URL's current votes per (model, framing).
+Feeding the same rows twice is a no-op. Re-classifying a URL under the same
+model and framing (classify --strata-file, a cascade run) subtracts its
+previous votes from the cube before adding the new ones. Dashboards and model
+refits read the cube instead of regrouping the full frame.
+
+A cube file from before model/framing were part of the key is rebuilt empty;
+`python scripts/cube.py` refills it from the frame and classifications.
+
+From R:
+    con <- DBI::dbConnect(RSQLite::SQLite(), "data/stance_cube.sqlite")
+    cube <- DBI::dbReadTable(con, "cube")
+(or read.stance.cube() in stance-functions.R)
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from typing import Optional
+
+import pandas as pd
+
+from stance import LABELS, STANCE_COLS, get_stance
+from strata import assign_strata, parse_dates
+
+COUNT_COLS = ["n_articles", "n_classified"] + STANCE_COLS + [f"n{lab}" for lab in LABELS]
+KEY_COLS = ["site", "month", "stratum", "model", "framing"]
+
+
+def _records(df: pd.DataFrame) -> list:
+    # Plain Python values; sqlite3 does not bind numpy integers
+    return list(df.astype(object).itertuples(index=False, name=None))
+
+
+class StanceCube:
+    def __init__(self, path: str = "data/stance_cube.sqlite"):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        cube_cols = [r[1] for r in self.conn.execute("PRAGMA table_info(cube)")]
+        if cube_cols and "model" not in cube_cols:
+            # Old layout without model/framing: its classification counts cannot be split
+            self.conn.executescript("DROP TABLE cube; DROP TABLE IF EXISTS articles;")
+        cols = ",\n".join(f"{c} INTEGER NOT NULL DEFAULT 0" for c in COUNT_COLS)
+        votes = ",\n".join(f"{c} INTEGER NOT NULL" for c in STANCE_COLS)
+        self.conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS cube (
+                site TEXT NOT NULL,
+                month TEXT NOT NULL,
+                stratum INTEGER NOT NULL,
+                model TEXT NOT NULL DEFAULT '',
+                framing TEXT NOT NULL DEFAULT '',
+                {cols},
+                PRIMARY KEY (site, month, stratum, model, framing)
+            );
+            CREATE TABLE IF NOT EXISTS articles (
+                url TEXT PRIMARY KEY,
+                site TEXT,
+                month TEXT,
+                stratum INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS classifications (
+                url TEXT NOT NULL,
+                model TEXT NOT NULL,
+                framing TEXT NOT NULL,
+                site TEXT,
+                month TEXT,
+                stratum INTEGER,
+                {votes},
+                stance TEXT NOT NULL,
+                PRIMARY KEY (url, model, framing)
+            );
+            """
+        )
+
+    @staticmethod
+    def _keys(df: pd.DataFrame) -> pd.DataFrame:
+        # site / month / stratum for each row; stratum 0 = outside the sampling design
+        date_col = "date" if "date" in df.columns else "published_time"
+        out = assign_strata(df, date_col=date_col)
+        month = parse_dates(out[date_col]).dt.strftime("%Y-%m")
+        return pd.DataFrame({
+            "url": df["url"].to_numpy(),
+            "site": df["site"].fillna("").to_numpy(),
+            "month": month.to_numpy(),
+            "stratum": out["strata"].fillna(0).astype(int).to_numpy(),
+        }).dropna(subset=["month"])
+
+    def _upsert(self, deltas: pd.DataFrame):
+        if deltas.empty:
+            return
+        cols = KEY_COLS + COUNT_COLS
+        deltas = deltas.reindex(columns=cols, fill_value=0)
+        updates = ", ".join(f"{c} = {c} + excluded.{c}" for c in COUNT_COLS)
+        self.conn.executemany(
+            f"INSERT INTO cube ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+            f"ON CONFLICT ({', '.join(KEY_COLS)}) DO UPDATE SET {updates}",
+            _records(deltas),
+        )
+
+    def add_articles(self, df: pd.DataFrame) -> int:
+        """Count newly collected articles (url, site, date/published_time). Returns rows added."""
+        keys = self._keys(df.drop_duplicates("url"))
+        known = pd.read_sql_query("SELECT url FROM articles", self.conn)["url"]
+        keys = keys.loc[~keys["url"].isin(known)]
+        deltas = keys.groupby(["site", "month", "stratum"]).size().rename("n_articles").reset_index()
+        deltas["model"], deltas["framing"] = "", ""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO articles (url, site, month, stratum) VALUES (?, ?, ?, ?)",
+                _records(keys[["url", "site", "month", "stratum"]]),
+            )
+            self._upsert(deltas)
+        return len(keys)
+
+    @staticmethod
+    def _cells(rows: pd.DataFrame, sign: int) -> pd.DataFrame:
+        # Per-cell contributions of classification rows (sign -1 takes them back out)
+        rows = rows.copy()
+        rows["n_classified"] = 1
+        for lab in LABELS:
+            rows[f"n{lab}"] = (rows["stance"] == lab).astype(int)
+        sums = rows.groupby(KEY_COLS)[["n_classified"] + STANCE_COLS + [f"n{lab}" for lab in LABELS]].sum()
+        return sums * sign
+
+    def add_classifications(self, df: pd.DataFrame, model: str, framing: str) -> int:
+        """
+        Record classify.py output of one (model, framing) run. Rows for URLs this
+        model and framing classified before replace their earlier votes. Returns rows changed.
+        """
+        df = df.drop_duplicates("url", keep="last").reset_index(drop=True)
+        # Classified rows that were never collected into the cube count as articles too
+        self.add_articles(df)
+
+        keys = self._keys(df)
+        rows = pd.concat(
+            [keys.reset_index(drop=True),
+             df.set_index("url").loc[keys["url"], STANCE_COLS].reset_index(drop=True).astype(int)],
+            axis=1,
+        )
+        rows["stance"] = get_stance(rows[STANCE_COLS].to_numpy())
+        rows["model"], rows["framing"] = model, framing
+
+        cols = ["url", "model", "framing", "site", "month", "stratum"] + STANCE_COLS + ["stance"]
+        old = pd.read_sql_query(
+            f"SELECT {', '.join(cols)} FROM classifications WHERE model = ? AND framing = ?",
+            self.conn, params=(model, framing),
+        )
+        old = old.loc[old["url"].isin(rows["url"])]
+        # Unchanged rows (same cell and votes) cancel out; only the rest is written
+        merged = rows.merge(old, on=["url"], how="left", suffixes=("", "_old"), indicator=True)
+        same = (merged["_merge"] == "both") & pd.concat(
+            [merged[c] == merged[f"{c}_old"] for c in ["site", "month", "stratum"] + STANCE_COLS], axis=1
+        ).all(axis=1)
+        changed = rows.loc[~same.to_numpy()]
+        old = old.loc[old["url"].isin(changed["url"])]
+
+        deltas = self._cells(changed, 1).add(self._cells(old, -1), fill_value=0).astype(int).reset_index()
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO classifications ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                _records(changed[cols]),
+            )
+            self._upsert(deltas)
+        return len(changed)
+
+    def query(self, site: Optional[str] = None, model: Optional[str] = None,
+              framing: Optional[str] = None) -> pd.DataFrame:
+        sql, params = "SELECT * FROM cube WHERE 1 = 1", []
+        for col, value in (("site", site), ("model", model), ("framing", framing)):
+            if value is not None:
+                sql, params = sql + f" AND {col} = ?", params + [value]
+        return pd.read_sql_query(sql + " ORDER BY site, month, stratum, model, framing", self.conn, params=params)
+
+    def monthly_counts(self, value: str = "n_articles", model: Optional[str] = None,
+                       framing: Optional[str] = None) -> pd.DataFrame:
+        # month x site table, same shape plot_articles_by_month builds from the frame;
+        # coverage comes from the model = '' rows, anything else from the classification rows
+        if value == "n_articles":
+            cube = self.query(model="", framing="")
+        else:
+            cube = self.query(model=model, framing=framing)
+            cube = cube.loc[cube["model"] != ""]
+        wide = cube.pivot_table(index="month", columns="site", values=value, aggfunc="sum", fill_value=0)
+        wide.index = pd.PeriodIndex(wide.index, freq="M").to_timestamp()
+        return wide
+
+
+if __name__ == "__main__":
+    cube = StanceCube("data/stance_cube.sqlite")
+    print(cube.add_articles(pd.read_csv("data/sampling_frame.csv")), "articles added")
+    main = pd.read_csv("data/sentiment_classification_main.csv")
+    print(cube.add_classifications(main, model="gemma-3n-e4b-it", framing="health vs. economy"), "classifications added")
+    print(cube.query().head())
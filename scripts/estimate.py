@@ -0,0 +1,158 @@
+"""
+estimate
+--------
+Design-based (stratified) estimates of stance proportions with bootstrap
+confidence intervals, vectorized with NumPy.
+
+Final stances come from the vote counts via stance.get_stance (the get.stance
+rules). For each stratum h the sample proportions p_h of A..D are combined
+with the frame's stratum sizes N_h into design-weighted proportions for any
+group of strata (sites, COVID / non-COVID, all), with the same estimator and
+variance as estimate_group_p in sample-size.R:
+
+    p = sum_h W_h p_h,   W_h = N_h / sum N_h
+    var = sum_h W_h^2 (1 - n_h/N_h) p_h (1 - p_h) / n_h
+
+Strata without sampled articles are left out of a group and the weights of the
+rest renormalized.
+
+Bootstrap replicates resample each stratum's n_h stances with replacement. A
+resample of categorical outcomes is a multinomial draw, so all B x H replicates
+come from a single rng.multinomial call. They are shrunk towards p_h by
+sqrt(1 - n_h/N_h), so their variance matches the finite-population variance
+above (and they stay within [0, 1]). Group replicates are one einsum with the
+weight matrix.
+"""
+
+from __future__ import annotations
+
+import argparse
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from stance import LABELS, STANCE_COLS, get_stance
+from strata import COVID_STRATA, N_STRATA, NOTCOVID_STRATA, SITE_OFFSETS, assign_strata
+
+STRATA = np.arange(1, N_STRATA + 1)
+
+
+def default_groups() -> Dict[str, list]:
+    groups = {site: list(range(off + 1, off + 14)) for site, off in SITE_OFFSETS.items()}
+    groups["covid"] = COVID_STRATA
+    groups["notcovid"] = NOTCOVID_STRATA
+    groups["all"] = STRATA.tolist()
+    return groups
+
+
+def stratum_sizes(frame: pd.DataFrame) -> np.ndarray:
+    """N_h for strata 1..N_STRATA from the sampling frame."""
+    if "strata" not in frame.columns:
+        frame = assign_strata(frame, date_col="date" if "date" in frame.columns else "published_time")
+    h = frame["strata"].dropna().astype(int).to_numpy()
+    return np.bincount(h, minlength=N_STRATA + 1)[1:]
+
+
+def stance_counts(df: pd.DataFrame) -> np.ndarray:
+    """H x 4 matrix of final-stance counts (A..D) per stratum, from the vote columns."""
+    df = df.dropna(subset=["strata"])
+    label = np.searchsorted(LABELS, get_stance(df[STANCE_COLS].to_numpy()))
+    h = df["strata"].astype(int).to_numpy() - 1
+    return np.bincount(h * 4 + label, minlength=N_STRATA * 4).reshape(N_STRATA, 4)
+
+
+def stratified_estimates(
+    counts: np.ndarray,
+    N_h: np.ndarray,
+    *,
+    groups: Optional[Dict[str, Iterable[int]]] = None,
+    B: int = 5000,
+    level: float = 0.95,
+    seed: Optional[int] = 234,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    counts : H x 4 final-stance counts per stratum; N_h : frame size per stratum.
+    Returns (per-stratum, per-group) long tables with p.hat, analytic se, bootstrap se and CI.
+    """
+    groups = default_groups() if groups is None else groups
+    counts = np.asarray(counts, dtype=np.int64)
+    N_h = np.asarray(N_h, dtype=float)
+    n_h = counts.sum(axis=1)
+    sampled = n_h > 0
+    n_safe = np.maximum(n_h, 1)
+
+    p_h = counts / n_safe[:, None]
+    fpc = np.where(N_h > 0, 1 - n_h / np.maximum(N_h, 1), 1.0).clip(0, 1)
+    var_h = fpc[:, None] * p_h * (1 - p_h) / n_safe[:, None]
+
+    # B x H x 4 stratified bootstrap replicates in one draw
+    rng = np.random.default_rng(seed)
+    pvals = np.where(sampled[:, None], p_h, 0.25)
+    boot = rng.multinomial(n_h, pvals, size=(B, N_STRATA)) / n_safe[:, None]
+    scale = np.sqrt(fpc)
+    boot = p_h + (boot - p_h) * scale[:, None]
+
+    # G x H weights, renormalized over the sampled strata of each group
+    names = list(groups)
+    W = np.zeros((len(names), N_STRATA))
+    for g, name in enumerate(names):
+        idx = np.asarray(list(groups[name])) - 1
+        W[g, idx] = N_h[idx] * sampled[idx]
+    W /= np.maximum(W.sum(axis=1, keepdims=True), 1e-12)
+
+    p_g = W @ p_h
+    var_g = (W ** 2) @ var_h
+    boot_g = np.einsum("gh,bhk->bgk", W, boot)
+
+    alpha = (1 - level) / 2
+    lo_h, hi_h = np.quantile(boot, [alpha, 1 - alpha], axis=0)
+    lo_g, hi_g = np.quantile(boot_g, [alpha, 1 - alpha], axis=0)
+
+    def long(keys, key_name, p, var, reps, lo, hi, extra):
+        out = pd.DataFrame({
+            key_name: np.repeat(keys, 4),
+            "stance": np.tile(LABELS, len(keys)),
+            "p.hat": p.ravel(),
+            "se": np.sqrt(var).ravel(),
+            "boot.se": reps.std(axis=0, ddof=1).ravel(),
+            "lower": lo.ravel(),
+            "upper": hi.ravel(),
+        })
+        for col, values in extra.items():
+            out.insert(1, col, np.repeat(values, 4))
+        return out
+
+    by_stratum = long(STRATA, "strata", p_h, var_h, boot, lo_h, hi_h, {"n.h": n_h, "N.h": N_h.astype(int)})
+    by_stratum = by_stratum.loc[np.repeat(sampled, 4)].reset_index(drop=True)
+    n_g = np.array([n_h[np.asarray(list(groups[name])) - 1].sum() for name in names])
+    by_group = long(np.array(names), "group", p_g, var_g, boot_g, lo_g, hi_g, {"n": n_g})
+    return by_stratum, by_group
+
+
+def estimate(classified: pd.DataFrame, frame: pd.DataFrame, **kwargs) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Classification output (classify.py) + sampling frame -> (per-stratum, per-group) estimates."""
+    if "strata" not in classified.columns:
+        classified = assign_strata(classified)
+    return stratified_estimates(stance_counts(classified), stratum_sizes(frame), **kwargs)
+
+
+if __name__ == "__main__":
+    import time
+
+    ap = argparse.ArgumentParser(description="Stratified stance estimates with bootstrap CIs")
+    ap.add_argument("--classified", default="data/sentiment_classification_main.csv")
+    ap.add_argument("--frame", default="data/sampling_frame.csv")
+    ap.add_argument("--B", type=int, default=5000)
+    ap.add_argument("--level", type=float, default=0.95)
+    ap.add_argument("--out", default="data/stance_estimates")
+    args = ap.parse_args()
+
+    classified = pd.read_csv(args.classified)
+    frame = pd.read_csv(args.frame, usecols=lambda c: c in ("site", "date", "published_time", "strata"))
+    start = time.perf_counter()
+    by_stratum, by_group = estimate(classified, frame, B=args.B, level=args.level)
+    print(f"{args.B} bootstrap replicates in {time.perf_counter() - start:.2f}s")
+    print(by_group.round(3).to_string(index=False))
+    by_stratum.to_csv(f"{args.out}_strata.csv", index=False)
+    by_group.to_csv(f"{args.out}_groups.csv", index=False)
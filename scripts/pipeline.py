@@ -0,0 +1,361 @@
+"""
+pipeline
+--------
+Stage-level orchestrator for the whole pipeline, with content-hash skipping.
+
+Each Stage declares the files it reads (inputs), the files it writes
+(outputs), files or directories it reads and updates in place (state), its
+entry script(s) (code) and its parameters. Before a stage runs its
+fingerprint is computed from
+    - the SHA-256 of every input file,
+    - the SHA-256 of the script its command runs (scripts/cli.py for most
+      stages, so changed defaults there count), without following its imports,
+    - the SHA-256 of its code and of every local module / R file it pulls in
+      (import and source() statements are followed, lazy imports included),
+    - its parameters.
+A stage is skipped when the fingerprint matches the one recorded after its last
+successful run and its outputs and state are still on disk and unchanged (a
+seen-URL store deleted or updated by another tool makes collect stale). The state is
+kept in data/pipeline_state.json, together with a (size, mtime) -> hash cache so
+unchanged files are not re-read on every run.
+
+Stage order comes from the data: a stage depends on every stage that writes
+one of its inputs. Stages whose dependencies are done run in parallel (each
+stage is a subprocess). Because downstream fingerprints are taken after the
+upstream stage finished, an upstream re-run that produces byte-identical
+output does not invalidate anything after it.
+
+    python scripts/pipeline.py                      # everything that is stale
+    python scripts/pipeline.py --dry-run
+    python scripts/pipeline.py --only classify model
+    python scripts/pipeline.py --force sample
+(or python scripts/cli.py run ...)
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+ROOT = Path(__file__).resolve().parent.parent
+SCRIPTS = ROOT / "scripts"
+STATE_PATH = ROOT / "data" / "pipeline_state.json"
+PY = sys.executable
+
+
+@dataclass
+class Stage:
+    name: str
+    cmd: List[str]
+    inputs: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    state: List[str] = field(default_factory=list)
+    code: List[str] = field(default_factory=list)
+    params: Dict[str, Any] = field(default_factory=dict)
+
+    def argv(self) -> List[str]:
+        # Parameters are passed as --key value flags (lists as several values, True as a bare flag)
+        args = list(self.cmd)
+        for key, value in self.params.items():
+            if value is None or value is False:
+                continue
+            args.append(f"--{key}")
+            if value is True:
+                continue
+            if isinstance(value, (list, tuple)):
+                args.extend(str(v) for v in value)
+            else:
+                args.append(str(value))
+        return args
+
+
+def default_stages() -> List[Stage]:
+    cli = [PY, "scripts/cli.py"]
+    return [
+        Stage(
+            "harvest",
+            cli + ["harvest"],
+            outputs=["data/sitemaps.json", "data/sitemap_lastmod.json"],
+            code=["scripts/sources/harvest.py"],
+            params={"domains": ["deseretnews", "ksl"]},
+        ),
+        Stage(
+            "discover",
+            [PY, "scripts/sources/discover.py"],
+            inputs=["data/utah_news_sources.csv"],
+            outputs=["data/discovered_sitemaps.json"],
+            code=["scripts/sources/discover.py"],
+        ),
+        # Other county outlets are harvested into their own file: the sampling design
+        # (and so the frame built from sitemaps.json) covers Deseret News and KSL only
+        Stage(
+            "harvest-outlets",
+            cli + ["harvest"],
+            inputs=["data/discovered_sitemaps.json"],
+            outputs=["data/outlet_sitemaps.json", "data/outlet_sitemap_lastmod.json"],
+            code=["scripts/sources/harvest.py"],
+            params={
+                "discovered": "data/discovered_sitemaps.json",
+                "out": "data/outlet_sitemaps.json",
+                "lastmod-out": "data/outlet_sitemap_lastmod.json",
+            },
+        ),
+        Stage(
+            "collect",
+            cli + ["collect"],
+            inputs=["data/sitemaps.json"],
+            outputs=["data/vaccine_articles.json"],
+            state=["data/seen_urls.sqlite", "data/textstore"],
+            code=["scripts/sample_frame.py", "scripts/textstore.py"],
+            params={
+                "start-date": "2017-01-01",
+                "end-date": "2024-01-01",
+                "decided": "data/seen_urls.sqlite",
+                "text-store": "data/textstore",
+            },
+        ),
+        Stage(
+            "frame",
+            cli + ["frame"],
+            inputs=["data/vaccine_articles_1.json", "data/vaccine_articles.json"],
+            outputs=["data/sampling_frame.csv"],
+            code=["scripts/collect.py"],
+        ),
+        Stage(
+            "sample",
+            ["Rscript", "scripts/sample_allocation.R"],
+            inputs=["data/sampling_frame.csv", "data/sentiment_classification_prelim.csv"],
+            outputs=["data/prelim.csv", "data/main_sample.csv", "data/main_sample_nh.csv"],
+            code=["scripts/sample_allocation.R"],
+        ),
+        Stage(
+            "classify",
+            cli + ["classify"],
+            inputs=["data/main_sample.csv"],
+            outputs=["data/sentiment_classification_main.csv"],
+            code=["scripts/classify.py"],
+            params={"model": "gemma-3n-e4b-it", "framing": "health vs. economy"},
+        ),
+        Stage(
+            "display",
+            ["Rscript", "scripts/display_sample.R"],
+            inputs=["data/sentiment_classification_main.csv"],
+            code=["scripts/display_sample.R"],
+        ),
+        Stage(
+            "model",
+            ["Rscript", "scripts/model.R"],
+            inputs=["data/sentiment_classification_main.csv"],
+            code=["scripts/model.R"],
+        ),
+    ]
+
+
+_R_SOURCE = re.compile(r"""source\(\s*["']([^"']+)["']""")
+
+
+def code_closure(paths: Iterable[str]) -> List[Path]:
+    """Entry scripts plus every local Python module / sourced R file they pull in."""
+    search = [SCRIPTS, SCRIPTS / "sources"]
+    seen: Set[Path] = set()
+    todo = [ROOT / p for p in paths]
+    while todo:
+        path = todo.pop()
+        if path in seen or not path.exists():
+            continue
+        seen.add(path)
+        text = path.read_text(encoding="utf-8")
+        if path.suffix == ".R":
+            todo.extend(ROOT / m for m in _R_SOURCE.findall(text))
+            continue
+        for node in ast.walk(ast.parse(text)):
+            if isinstance(node, ast.Import):
+                names = [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                top = name.split(".")[0]
+                todo.extend(d / f"{top}.py" for d in search if (d / f"{top}.py").exists())
+    return sorted(seen)
+
+
+class FileHasher:
+    """SHA-256 of files, cached by (size, mtime) across runs."""
+
+    def __init__(self, cache: Optional[Dict[str, list]] = None):
+        self.cache = cache if cache is not None else {}
+
+    def __call__(self, path: Path) -> Optional[str]:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        key = str(path.relative_to(ROOT)) if path.is_relative_to(ROOT) else str(path)
+        cached = self.cache.get(key)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        self.cache[key] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def tree(self, path: Path) -> Optional[str]:
+        """Hash of a file, or of every file under a directory (by relative path)."""
+        if not path.is_dir():
+            return self(path)
+        h = hashlib.sha256()
+        for sub in sorted(p for p in path.rglob("*") if p.is_file()):
+            h.update(f"{sub.relative_to(path)}={self(sub)}\n".encode())
+        return h.hexdigest()
+
+
+class Pipeline:
+    def __init__(self, stages: Optional[List[Stage]] = None, state_path: Path = STATE_PATH):
+        self.stages = {s.name: s for s in (stages or default_stages())}
+        self.state_path = Path(state_path)
+        self.state = json.loads(self.state_path.read_text()) if self.state_path.exists() else {}
+        self.state.setdefault("stages", {})
+        self.hash = FileHasher(self.state.setdefault("files", {}))
+        self._pending: Dict[str, str] = {}
+
+        writers = {out: s.name for s in self.stages.values() for out in s.outputs}
+        self.deps = {
+            s.name: {writers[i] for i in s.inputs if i in writers and writers[i] != s.name}
+            for s in self.stages.values()
+        }
+
+    def fingerprint(self, stage: Stage) -> str:
+        h = hashlib.sha256()
+        # The script the command runs (e.g. scripts/cli.py and its defaults), not what it imports
+        entry = [ROOT / a for a in stage.cmd[1:2] if (ROOT / a).is_file()]
+        for kind, paths in (("in", [ROOT / p for p in stage.inputs]), ("entry", entry),
+                            ("code", code_closure(stage.code))):
+            for path in paths:
+                h.update(f"{kind}:{path.relative_to(ROOT)}={self.hash(path)}\n".encode())
+        h.update(json.dumps({"cmd": stage.cmd[1:], "params": stage.params}, sort_keys=True).encode())
+        return h.hexdigest()
+
+    def is_fresh(self, stage: Stage, fingerprint: str) -> bool:
+        last = self.state["stages"].get(stage.name)
+        if not last or last["fingerprint"] != fingerprint:
+            return False
+        # Outputs or state deleted or changed since the last run also make the stage stale
+        if any(self.hash.tree(ROOT / p) != last.get("state", {}).get(p) for p in stage.state):
+            return False
+        return all(self.hash(ROOT / out) == digest for out, digest in last["outputs"].items())
+
+    def _run(self, stage: Stage) -> float:
+        start = time.time()
+        subprocess.run(stage.argv(), cwd=ROOT, check=True)
+        return time.time() - start
+
+    def _record(self, stage: Stage, fingerprint: str, seconds: float):
+        self.state["stages"][stage.name] = {
+            "fingerprint": fingerprint,
+            "outputs": {out: self.hash(ROOT / out) for out in stage.outputs},
+            "state": {p: self.hash.tree(ROOT / p) for p in stage.state},
+            "seconds": round(seconds, 1),
+            "finished": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self.save()
+
+    def save(self):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.state, indent=2))
+        os.replace(tmp, self.state_path)
+
+    def run(self, only: Optional[Iterable[str]] = None, force: Iterable[str] = (), jobs: int = 4,
+            dry_run: bool = False) -> Dict[str, str]:
+        """Run stale stages in dependency order; returns stage -> ran / skipped / failed / blocked."""
+        selected = set(only) if only else set(self.stages)
+        unknown = (selected | set(force)) - set(self.stages)
+        if unknown:
+            raise ValueError(f"Unknown stage(s): {sorted(unknown)}")
+        force = set(force)
+        status: Dict[str, str] = {}
+        # Stages left out by --only count as done: their outputs are used as they are
+        done = set(self.stages) - selected
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            while len(status) < len(selected):
+                for name in sorted(selected - set(status) - set(running.values())):
+                    deps = self.deps[name] & selected
+                    if any(status.get(d) in ("failed", "blocked") for d in deps):
+                        status[name] = "blocked"
+                        print(f"[{name}] blocked by a failed upstream stage")
+                        continue
+                    if not deps <= done:
+                        continue
+                    stage = self.stages[name]
+                    fp = self.fingerprint(stage)
+                    if name not in force and self.is_fresh(stage, fp):
+                        status[name] = "skipped"
+                        done.add(name)
+                        print(f"[{name}] up to date")
+                    elif dry_run:
+                        # Downstream stages are judged on the current files
+                        status[name] = "stale"
+                        done.add(name)
+                        print(f"[{name}] would run: {shlex.join(stage.argv())}")
+                    else:
+                        print(f"[{name}] running: {shlex.join(stage.argv())}")
+                        running[pool.submit(self._run, stage)] = name
+                        self._pending[name] = fp
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    stage = self.stages[name]
+                    fp = self._pending.pop(name)
+                    try:
+                        seconds = future.result()
+                    except (subprocess.CalledProcessError, OSError) as e:
+                        status[name] = "failed"
+                        print(f"[{name}] failed: {e}")
+                        continue
+                    self._record(stage, fp, seconds)
+                    status[name] = "ran"
+                    done.add(name)
+                    print(f"[{name}] done in {seconds:.1f}s")
+        return status
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run stale pipeline stages")
+    ap.add_argument("--only", nargs="+", help="run just these stages (their inputs are used as they are)")
+    ap.add_argument("--force", nargs="+", default=[], help="re-run these stages even if up to date")
+    ap.add_argument("--jobs", type=int, default=4, help="stages run in parallel")
+    ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--state", default=str(STATE_PATH))
+    args = ap.parse_args(argv)
+
+    status = Pipeline(state_path=Path(args.state)).run(
+        only=args.only, force=args.force, jobs=args.jobs, dry_run=args.dry_run
+    )
+    print(status)
+    if "failed" in status.values():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
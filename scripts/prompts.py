@@ -201,3 +201,35 @@ def get_prompts(framing: str):
         ]
 
     return prompts
+
+
+def template_question(template: str) -> str:
+    # Instructions of a template without its passage block: everything above
+    # the delimiter line that introduces {content}
+    lines = template.split("\n")
+    idx = next(i for i, line in enumerate(lines) if "{content}" in line)
+    return "\n".join(lines[:max(idx - 1, 0)]).strip()
+
+
+def get_shared_prompt(framing: str) -> str:
+    """
+    One prompt asking every template's question over a single copy of the
+    passage. Formats like the individual templates (topic, content); the
+    answer is one "<n>: <label>" line per template, in template order.
+    """
+    questions = [template_question(t) for t in get_prompts(framing)]
+    n = len(questions)
+    parts = [
+        f"You will read one passage and then answer {n} separate coding questions about it.\n"
+        "Answer each question independently, exactly as if it were the only question asked.\n\n"
+        "=== PASSAGE ===\n"
+        "{content}\n"
+        "=== END PASSAGE ===\n"
+    ]
+    for i, question in enumerate(questions, start=1):
+        parts.append(f"--- QUESTION {i} ---\n{question}\n")
+    parts.append(
+        f"Reply with exactly {n} lines, one per question, in the form \"<question number>: <label>\" "
+        "(for example \"1: A\"), and nothing else."
+    )
+    return "\n".join(parts)
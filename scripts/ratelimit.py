@@ -0,0 +1,135 @@
+"""
+ratelimit
+---------
+Host-wide sliding-window ledger for LLM quota, shared by every process that
+classifies with the same API key.
+
+Every call is logged in one SQLite file as (time, estimated tokens). Before
+each call a SentimentClassifier acquires one request and its estimated
+tokens; the call goes ahead only if the requests and tokens logged in the
+last 60 seconds leave room for it, otherwise it sleeps until enough of the
+oldest calls leave the window. No 60 s window can therefore exceed the quota,
+however long the ledger sat idle before. Once the API reports real token
+counts the logged estimate is corrected. A 429 that slips through anyway
+blocks the key for every process until its retryDelay has passed, so
+concurrent jobs back off together instead of retry-storming.
+
+The key itself is never stored, only a short hash of it.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_PATH = Path(tempfile.gettempdir()) / "llm-ratelimit.sqlite"
+
+# Gemma via the Gemini API (free tier): 30 requests and 15k tokens per minute
+DEFAULT_RPM = 30
+DEFAULT_TPM = 15_000
+WINDOW_SEC = 60.0
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English prose
+    return max(1, len(text) // 4)
+
+
+class RateLedger:
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        *,
+        rpm: float = DEFAULT_RPM,
+        tpm: float = DEFAULT_TPM,
+        headroom: float = 0.9,
+        path: Path | str = DEFAULT_PATH,
+    ):
+        self.key = hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+        # Run just under the quota so clock skew and estimate error don't cause 429s
+        self.capacity = {"req": rpm * headroom, "tok": tpm * headroom}
+        self.conn = sqlite3.connect(str(path), timeout=60, isolation_level=None)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS calls (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL,
+                ts REAL NOT NULL,
+                tokens REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS calls_key_ts ON calls (key, ts);
+            CREATE TABLE IF NOT EXISTS blocks (
+                key TEXT PRIMARY KEY,
+                blocked_until REAL NOT NULL
+            );
+            """
+        )
+        # Row of this process's last acquired call, corrected by record_usage
+        self._last_call: Optional[int] = None
+
+    def _window(self, now: float):
+        # Calls still inside the window (oldest first) and the key's block
+        self.conn.execute("DELETE FROM calls WHERE key = ? AND ts <= ?", (self.key, now - WINDOW_SEC))
+        calls = self.conn.execute(
+            "SELECT ts, tokens FROM calls WHERE key = ? ORDER BY ts", (self.key,)
+        ).fetchall()
+        row = self.conn.execute("SELECT blocked_until FROM blocks WHERE key = ?", (self.key,)).fetchone()
+        return calls, row[0] if row else 0.0
+
+    def _wait_for(self, calls, tokens: float, now: float) -> float:
+        # Seconds until enough of the oldest calls leave the window for one more call
+        used_req, used_tok = len(calls), sum(t for _, t in calls)
+        wait = 0.0
+        for ts, tok in calls:
+            if used_req + 1 <= self.capacity["req"] and used_tok + tokens <= self.capacity["tok"]:
+                break
+            used_req, used_tok = used_req - 1, used_tok - tok
+            wait = ts + WINDOW_SEC - now
+        return max(wait, 0.0)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Block until one request and `tokens` tokens fit in the window; returns seconds waited."""
+        # A single call larger than the whole quota can never fit; let it through into an empty window
+        needed = min(tokens, self.capacity["tok"])
+        waited = 0.0
+        while True:
+            now = time.time()
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                calls, blocked_until = self._window(now)
+                blocked = blocked_until - now
+                used_tok = sum(t for _, t in calls)
+                if blocked <= 0 and len(calls) + 1 <= self.capacity["req"] and used_tok + needed <= self.capacity["tok"]:
+                    cur = self.conn.execute(
+                        "INSERT INTO calls (key, ts, tokens) VALUES (?, ?, ?)", (self.key, now, tokens)
+                    )
+                    self._last_call = cur.lastrowid
+                    self.conn.execute("COMMIT")
+                    return waited
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            wait = max(blocked, self._wait_for(calls, needed, now), 0.05)
+            time.sleep(wait)
+            waited += wait
+
+    def record_usage(self, estimated: int, actual: int):
+        # Charge (or refund) the difference once the API reports real token counts
+        delta = actual - estimated
+        if delta == 0 or self._last_call is None:
+            return
+        self.conn.execute("UPDATE calls SET tokens = tokens + ? WHERE id = ?", (delta, self._last_call))
+
+    def block(self, seconds: float):
+        """Quota exceeded anyway: every process using this key waits `seconds`."""
+        until = time.time() + seconds
+        self.conn.execute(
+            "INSERT INTO blocks (key, blocked_until) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET blocked_until = MAX(blocked_until, excluded.blocked_until)",
+            (self.key, until),
+        )
@@ -8,8 +8,10 @@ import time
 from tqdm import tqdm
 from datetime import datetime
 
-from extract import extract_article_text
+from extract import FetchError, extract_article_text, fast_path_report
 from sampleurl import read_annotations, get_dates, filter_urls
+from strata import assign_strata
+from urlnorm import SeenURLs, canonicalize_url, dedupe_urls
 
 
 DEFAULT_KEY_WORDS = [
@@ -37,6 +39,9 @@ class VaccineArticleCollector:
         end_date: str = "2024-01-01",
         keywords: Optional[Iterable[str]] = None,
         sleep_sec: float = 0.5,
+        decided_path: Optional[str] = None,
+        cube=None,
+        text_store=None,
     ):
         self.json_in = Path(json_in)
         self.json_out = Path(json_out)
@@ -54,6 +59,19 @@ class VaccineArticleCollector:
         # URL -> record dict
         self._results: Dict[str, Dict[str, Any]] = {}
 
+        # Canonical URL -> sitemap lastmod ("" if unknown) for every URL already
+        # scraped, accepted or not. With decided_path this is a persistent
+        # urlnorm.SeenURLs store, so no URL form is fetched twice across runs
+        self.decided_path = Path(decided_path) if decided_path else None
+        self._decided = SeenURLs(str(self.decided_path)) if self.decided_path else {}
+        # URLs accepted during this run
+        self._new: List[str] = []
+        # Optional cube.StanceCube, updated with accepted articles on save()
+        self.cube = cube
+        # Optional textstore.TextStore: keeps every extracted article, accepted or not,
+        # so a new keyword list or date range can be applied offline (TextStore.refilter)
+        self.text_store = text_store
+
     def _domains(self) -> List[str]:
         with self.json_in.open("r", encoding="utf-8") as f:
             data = json.load(f)
@@ -91,33 +109,143 @@ class VaccineArticleCollector:
                 "text": text,
             }
             return rec
+        except FetchError:
+            raise
         except Exception:
             return None
 
-    def _process_url(self, url: str):
-        if url in self._results:
-            return
+    def decide(self, url: str) -> Optional[Dict[str, Any]]:
+        # Scrape one URL; returns the record if it belongs in the frame, else None.
+        # Raises extract.FetchError when the page could not be downloaded for now (network,
+        # 5xx, 429): nothing was judged. A gone page (404, 410, ...) is a rejection
         rec = self._scrape(url)
+        if rec and self.text_store is not None:
+            self.text_store.add(rec)
         pt = datetime.strptime(rec["published_time"][:10], "%Y-%m-%d") if rec and rec.get("published_time") else None
         if rec and self._has_keywords(rec["text"]) and pt and pt >= self.start and pt <= self.end:
+            return rec
+        return None
+
+    def _process_url(self, url: str, lastmod: str = "", force: bool = False):
+        key = canonicalize_url(url)
+        if not force and (url in self._results or key in self._decided):
+            return
+        try:
+            rec = self.decide(url)
+        except FetchError:
+            # Left undecided (and any earlier record kept) so a later run retries it
+            return
+        if rec:
             self._results[url] = rec
+            self._new.append(url)
+        else:
+            # A changed page that no longer qualifies drops its previous record
+            self._results.pop(url, None)
+        self._decided[key] = lastmod
+
+    def _needs_scrape(self, url: str, lastmod: str) -> bool:
+        key = canonicalize_url(url)
+        if key not in self._decided:
+            return True
+        seen = self._decided[key]
+        if not seen:
+            # Decided before lastmod was tracked; adopt the current stamp instead of rescraping
+            self._decided[key] = lastmod
+            return False
+        return bool(lastmod) and lastmod != seen
+
+    def _crawl_urls(self, domain: str) -> List[str]:
+        urls = self._urls_for_domain(domain)
+        if domain == "deseretnews":
+            urls = self._urls_in_date_range(urls)
+        # One fetch per article however many URL forms the sitemap lists
+        return dedupe_urls(urls)
+
+    def _load_existing(self):
+        # Articles already in json_out are kept, so save() appends to the existing output
+        if self.json_out.exists():
+            self._results.update(json.loads(self.json_out.read_text(encoding="utf-8")))
 
     def process(self, domains = None, urlstart = None):
+        self._load_existing()
         domains = domains if domains is not None else self._domains()
         for domain in domains:
-            urls = self._urls_for_domain(domain)
-            if domain == "deseretnews":
-                urls = self._urls_in_date_range(urls)
+            urls = self._crawl_urls(domain)
             start = urlstart if urlstart is not None else 0
             urls = urls[start:]
             for url in tqdm(urls, desc=f"Processing {domain}"):
                 self._process_url(url)
                 if self.sleep_sec:
                     time.sleep(self.sleep_sec)
+        for domain, stats in fast_path_report().items():
+            print(f"Fast path {domain}: {stats['hits']}/{stats['attempts']} ({stats['hit_rate']:.1%}), "
+                  f"{stats['bytes_per_page'] / 1024:.0f} KiB and {stats['requests_per_page']:.2f} requests per page")
+
+    def process_delta(self, lastmod_json: Optional[str] = None, domains=None):
+        """
+        Incremental crawl: scrape only sitemap URLs that were never decided, or
+        whose lastmod changed since they were. Articles already in json_out are
+        kept, so save() appends to the existing output.
+        """
+        lastmod: Dict[str, str] = {}
+        if lastmod_json:
+            lastmod = json.loads(Path(lastmod_json).read_text(encoding="utf-8"))
+        self._load_existing()
+
+        domains = domains if domains is not None else self._domains()
+        for domain in domains:
+            urls = self._crawl_urls(domain)
+            todo = [url for url in urls if self._needs_scrape(url, lastmod.get(url, ""))]
+            print(f"{domain}: {len(todo)} new or changed of {len(urls)} URLs")
+            for url in tqdm(todo, desc=f"Delta {domain}"):
+                # A changed page replaces its previous record
+                self._process_url(url, lastmod.get(url, ""), force=True)
+                if self.sleep_sec:
+                    time.sleep(self.sleep_sec)
+
+    def enqueue(self, queue, domains=None) -> int:
+        # Load every crawl URL into a workqueue.WorkQueue for sharded workers
+        domains = domains if domains is not None else self._domains()
+        added = 0
+        seen = set()
+        for domain in domains:
+            todo = []
+            for url in self._crawl_urls(domain):
+                key = canonicalize_url(url)
+                if key not in seen and key not in self._decided:
+                    seen.add(key)
+                    todo.append((url, domain))
+            added += queue.enqueue(todo)
+        return added
+
+    def merge_queue(self, queue):
+        # Collect committed results from all workers; save() then writes the usual output
+        # (earlier articles included) and counts the newly merged ones into the cube
+        self._load_existing()
+        for url, rec in queue.results().items():
+            if url not in self._results:
+                self._new.append(url)
+            self._results[url] = rec
+        for url in queue.done_urls():
+            self._decided[canonicalize_url(url)] = self._decided.get(canonicalize_url(url), "")
+
+    def affected_strata(self) -> List[int]:
+        # Design strata touched by the articles accepted in this run
+        if not self._new:
+            return []
+        df = pd.DataFrame([self._results[url] for url in self._new])
+        df = assign_strata(df, date_col="published_time")
+        return sorted(int(h) for h in df["strata"].dropna().unique())
 
     def save(self):
         payload = self._results if self._results else {}
         self.json_out.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        if self.decided_path:
+            self._decided.flush()
+        if self.text_store is not None:
+            self.text_store.flush()
+        if self.cube is not None and self._new:
+            self.cube.add_articles(pd.DataFrame([self._results[url] for url in self._new]))
 
 if __name__ == "__main__":
 
@@ -131,3 +259,17 @@ if __name__ == "__main__":
     )
     collector.process(domains=['ksl'], urlstart=32912)
     collector.save()
+
+    # Daily refresh: re-harvest sitemaps (sources/harvest.py), then scrape only
+    # what is new or changed and append it to the existing output
+    # collector = VaccineArticleCollector(
+    #     json_in="data/sitemaps.json",
+    #     json_out="data/vaccine_articles.json",
+    #     decided_path="data/seen_urls.sqlite",
+    # )
+    # collector.process_delta(lastmod_json="data/sitemap_lastmod.json")
+    # collector.save()
+    # with open("data/affected_strata.json", "w") as f:
+    #     json.dump(collector.affected_strata(), f)
+    # ... then re-classify only those strata:
+    # python scripts/cli.py classify --strata-file data/affected_strata.json
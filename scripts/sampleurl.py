@@ -2,7 +2,6 @@ import json
 import numpy as np
 import pandas as pd
 import re
-import matplotlib.pyplot as plt
 
 def read_annotations(json_file: str, domain: str):
     with open(json_file, "r", encoding="utf-8") as f:
@@ -36,6 +35,12 @@ def plot_articles_by_month(df):
           .unstack(fill_value=0)
           .to_timestamp()
     )
+    plot_monthly_counts(monthly_counts)
+
+#monthly_counts: month x site counts, e.g. StanceCube.monthly_counts() (cube.py)
+#which avoids regrouping the whole frame
+def plot_monthly_counts(monthly_counts):
+    import matplotlib.pyplot as plt
 
     plt.figure(figsize=(10, 4))
     for site in monthly_counts.columns:
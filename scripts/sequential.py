@@ -0,0 +1,187 @@
+"""
+sequential
+----------
+Sequential (multi-round) stratified sampling for the LLM classification step.
+
+Instead of classifying a fixed sample per stratum (sample-size.R), articles are
+drawn in rounds. After each round every stratum's stance-proportion estimates
+and their variances are updated, and a stratum stops receiving API calls once
+the margin of error of all four stance proportions is below the target. Strata
+where nearly every article is "D" (2017-2019) converge after a few rounds and
+the remaining calls go to the high-variance COVID-era strata. Every stratum
+first gets min_n articles (under a tight max_calls, an equal share of at
+least 2), so a budget spent by Neyman weight never leaves a stratum unsampled.
+
+Variance per stratum and label uses the same finite-population form as
+estimate_group_p in sample-size.R, with p smoothed to (x + 1) / (n + 2) so a
+stratum cannot look converged just because every draw so far agreed.
+"""
+
+from __future__ import annotations
+
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from stance import LABELS, STANCE_COLS, get_stance
+from strata import assign_strata
+
+
+class SequentialSampler:
+    def __init__(
+        self,
+        frame: pd.DataFrame,
+        classify_fn: Callable[[str], Dict[str, int]],
+        *,
+        moe: float = 0.10,
+        z: float = 1.96,
+        batch_size: int = 5,
+        min_n: int = 10,
+        calls_per_article: int = 1,
+        seed: int = 234,
+    ):
+        """
+        frame : sampling frame; strata are assigned from site/date if missing.
+        classify_fn : article text -> {"stanceA": .., "stanceB": .., "stanceC": .., "stanceD": ..}
+        moe : target margin of error (half-width at level z) for every stance proportion.
+        calls_per_article : LLM calls per article (number of prompt templates), for accounting.
+        """
+        if "strata" not in frame.columns:
+            frame = assign_strata(frame)
+        self.frame = frame.dropna(subset=["strata"]).reset_index(drop=True)
+        self.classify_fn = classify_fn
+        self.moe = moe
+        self.z = z
+        self.batch_size = batch_size
+        self.min_n = min_n
+        self.calls_per_article = calls_per_article
+        self.calls = 0
+
+        rng = np.random.default_rng(seed)
+        groups = self.frame.groupby("strata").indices
+        # Random draw order per stratum; drawing the next k rows is sampling without replacement
+        self._order = {int(h): rng.permutation(idx) for h, idx in groups.items()}
+        self.N_h = {h: len(idx) for h, idx in self._order.items()}
+        self.n_h = {h: 0 for h in self._order}
+        # stratum -> running A,B,C,D counts of final stances
+        self._counts = {h: np.zeros(4, dtype=np.int64) for h in self._order}
+        self._rows: List[pd.DataFrame] = []
+
+    def _stats(self, h: int):
+        n, N = self.n_h[h], self.N_h[h]
+        p_hat = self._counts[h] / max(n, 1)
+        p_tilde = (self._counts[h] + 1) / (n + 2)
+        fpc = 1 - n / N
+        var = fpc * p_tilde * (1 - p_tilde) / max(n - 1, 1)
+        return p_hat, var
+
+    def margin(self, h: int) -> float:
+        if self.n_h[h] == 0:
+            return np.inf
+        _, var = self._stats(h)
+        return float(self.z * np.sqrt(var).max())
+
+    def converged(self, h: int) -> bool:
+        if self.n_h[h] >= self.N_h[h]:
+            return True
+        return self.n_h[h] >= self.min_n and self.margin(h) <= self.moe
+
+    def active(self) -> List[int]:
+        # Unconverged strata, highest estimated N_h * S_h (Neyman weight) first
+        def weight(h):
+            _, var = self._stats(h)
+            return self.N_h[h] * np.sqrt(var).max()
+        return sorted((h for h in self._order if not self.converged(h)), key=weight, reverse=True)
+
+    def _draw(self, h: int, k: int) -> pd.DataFrame:
+        idx = self._order[h][self.n_h[h]:self.n_h[h] + k]
+        batch = self.frame.loc[idx].copy()
+        votes = pd.DataFrame([self.classify_fn(text) for text in batch["text"]], index=batch.index)
+        batch[STANCE_COLS] = votes[STANCE_COLS]
+        self.calls += len(batch) * self.calls_per_article
+
+        labels = get_stance(batch[STANCE_COLS].to_numpy())
+        self._counts[h] += (labels[:, None] == LABELS).sum(axis=0)
+        self.n_h[h] += len(batch)
+        return batch
+
+    def _remaining(self, max_calls: Optional[int]) -> Optional[int]:
+        # Articles the call budget still allows (None: unlimited)
+        if max_calls is None:
+            return None
+        return max((max_calls - self.calls) // self.calls_per_article, 0)
+
+    def _floor(self, max_calls: Optional[int]):
+        # Every stratum gets min_n articles first (fewer, but at least 2, if the budget
+        # cannot cover min_n everywhere) so no stratum is left without an estimate
+        floor = self.min_n
+        budget = self._remaining(max_calls)
+        if budget is not None:
+            floor = min(floor, max(budget // len(self._order), 2))
+        for h in sorted(self._order):
+            k = min(floor, self.N_h[h]) - self.n_h[h]
+            budget = self._remaining(max_calls)
+            if budget is not None:
+                k = min(k, budget)
+            if k > 0:
+                self._rows.append(self._draw(h, k))
+
+    def run(self, max_calls: Optional[int] = None, max_rounds: int = 1000, verbose: bool = True) -> pd.DataFrame:
+        self._floor(max_calls)
+        if verbose:
+            print(f"Initial draw: {sum(self.n_h.values())} articles over {len(self._order)} strata, {self.calls} calls")
+        for r in range(max_rounds):
+            active = self.active()
+            if not active:
+                break
+            for h in active:
+                k = self.batch_size if self.n_h[h] >= self.min_n else self.min_n - self.n_h[h]
+                if max_calls is not None:
+                    k = min(k, (max_calls - self.calls) // self.calls_per_article)
+                    if k <= 0:
+                        break
+                self._rows.append(self._draw(h, k))
+            if verbose:
+                print(f"Round {r + 1}: {len(active)} active strata, {self.calls} calls")
+            if max_calls is not None and self.calls + self.calls_per_article > max_calls:
+                break
+        return self.classified()
+
+    def classified(self) -> pd.DataFrame:
+        # Same layout as classify.py output: sample columns followed by the vote counts
+        if not self._rows:
+            return self.frame.iloc[:0].assign(**{c: pd.Series(dtype=int) for c in STANCE_COLS})
+        return pd.concat(self._rows).reset_index(drop=True)
+
+    def summary(self) -> pd.DataFrame:
+        rows = []
+        for h in sorted(self._order):
+            p_hat, _ = self._stats(h)
+            rows.append({
+                "strata": h,
+                "N.h": self.N_h[h],
+                "n.h": self.n_h[h],
+                **{f"p.hat{lab}": p for lab, p in zip(LABELS, p_hat)},
+                "moe": self.margin(h),
+                "converged": self.converged(h),
+            })
+        return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    from classify import SentimentClassifier, classify_article, load_api_key, models
+
+    sf = pd.read_csv("data/sampling_frame.csv")
+    clf = SentimentClassifier(model=models[1], api_key=load_api_key())
+    sampler = SequentialSampler(
+        sf,
+        lambda text: classify_article(clf, text),
+        moe=0.10,
+        calls_per_article=len(clf.prompt_templates),
+    )
+    out = sampler.run()
+    out.insert(len(out.columns) - len(STANCE_COLS), "model", models[1])
+    out.to_csv("data/sentiment_classification_sequential.csv", index=False)
+    print(sampler.summary())
+    print(f"{sampler.calls} LLM calls")
@@ -0,0 +1,151 @@
+"""
+shared_context
+--------------
+Evaluation of the shared-context classification mode against the current
+per-template mode.
+
+Per-template mode (classify_article default) renders the full article into
+every prompt template, so a 20k-character passage is sent and billed once per
+template. Shared mode (classify_article(..., shared=True)) sends the passage
+once, followed by every template's question, and parses one label per
+template from the reply (prompts.get_shared_prompt). Either way the output is
+the same stanceA..stanceD vote counts.
+
+compare_modes() classifies the same articles both ways and reports calls and
+tokens, and with a real model per-template label agreement and final-stance
+(get.stance) agreement. LocalBackend is an offline stand-in for the
+google-genai client: it answers each question with a crude lexical match
+between the option descriptions and the passage, and reports token usage at
+~4 characters per token. It checks the plumbing and measures call and token
+cost without an API key. It answers both modes with the same heuristic on the
+same passage, so its agreement says nothing about the model and is not
+reported; agreement needs --remote.
+
+    python scripts/shared_context.py --n 50                 # local stand-in
+    python scripts/shared_context.py --n 50 --remote        # Gemma via the API
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from prompts import get_prompts, template_question
+from ratelimit import RateLedger, estimate_tokens
+from stance import get_stance
+
+_OPTION = re.compile(r"(?m)^\s*([A-D])\s*(?:=|:|-|\.|→)\s*(.+)$")
+_QUESTION = re.compile(r"(?m)^--- QUESTION (\d+) ---$")
+_WORD = re.compile(r"[a-z]{4,}")
+
+
+class LocalBackend:
+    """Offline stand-in exposing client.models.generate_content(model=, contents=, config=)."""
+
+    def __init__(self, framing: str = "health vs. economy"):
+        self.models = self
+        # Single-template prompts are recognized by their first line; the passage
+        # starts after the question's lines and the delimiter line that follows
+        self._question_lines = {}
+        for template in get_prompts(framing):
+            question = template_question(template)
+            self._question_lines[question.split("\n", 1)[0]] = question.count("\n") + 1
+
+    @staticmethod
+    def _answer(question: str, passage_words: set) -> str:
+        options = _OPTION.findall(question)
+        if not options:
+            return "D"
+        # Most option-description words found in the passage; ties go to the last
+        # option, which in every framing is the "unrelated / neutral" code
+        scores = [(len(set(_WORD.findall(desc.lower())) & passage_words), i) for i, (_, desc) in enumerate(options)]
+        return options[max(scores)[1]][0]
+
+    def generate_content(self, model: str, contents: str, config=None):
+        blocks = _QUESTION.split(contents)
+        if len(blocks) > 1:
+            # Shared prompt: passage first, then numbered questions
+            passage_words = set(_WORD.findall(blocks[0].lower()))
+            nums, questions = blocks[1::2], blocks[2::2]
+            text = "\n".join(f"{num}: {self._answer(q, passage_words)}" for num, q in zip(nums, questions))
+        else:
+            lines = contents.split("\n")
+            k = self._question_lines.get(lines[0])
+            passage = "\n".join(lines[k + 1:]) if k else contents
+            text = self._answer(contents, set(_WORD.findall(passage.lower())))
+        prompt_tokens, output_tokens = estimate_tokens(contents), estimate_tokens(text)
+        usage = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        )
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+
+def compare_modes(clf, texts, topic: str = "vaccination", agreement: bool = True) -> dict:
+    """Classify `texts` per-template and shared with the same classifier; cost, and agreement if asked."""
+    n_templates = len(clf.prompt_templates)
+    labels = {"per_template": [], "shared": []}
+    cost = {}
+    for mode in labels:
+        before = dict(clf.usage)
+        for text in texts:
+            if mode == "shared":
+                row = clf.classify_shared(topic, text)
+            else:
+                row = [clf.classify(topic, text, prompt_num=i)["label"] for i in range(n_templates)]
+            labels[mode].append(row)
+        cost[mode] = {k: clf.usage[k] - before[k] for k in before}
+
+    per, shared = (np.array(labels[m], dtype=object) for m in ("per_template", "shared"))
+
+    def counts(arr):
+        return np.stack([(arr == lab).sum(axis=1) for lab in "ABCD"], axis=1)
+
+    report = {"articles": len(per)}
+    if agreement:
+        report.update({
+            "template_agreement": (per == shared).mean(axis=0).round(3).tolist(),
+            "label_agreement": float((per == shared).mean()),
+            "stance_agreement": float((get_stance(counts(per)) == get_stance(counts(shared))).mean()),
+        })
+    report.update({
+        "unparsed_shared": int(pd.isna(shared).sum()),
+        "calls": {m: cost[m]["calls"] for m in cost},
+        "tokens": {m: cost[m]["tokens"] for m in cost},
+        "call_ratio": cost["shared"]["calls"] / max(cost["per_template"]["calls"], 1),
+        "token_ratio": cost["shared"]["tokens"] / max(cost["per_template"]["tokens"], 1),
+    })
+    return report
+
+
+if __name__ == "__main__":
+    from classify import SentimentClassifier, load_api_key, models
+
+    ap = argparse.ArgumentParser(description="Shared-context vs per-template classification")
+    ap.add_argument("--data", default="data/sentiment_classification_prelim.csv")
+    ap.add_argument("--n", type=int, default=50)
+    ap.add_argument("--framing", default="health vs. economy")
+    ap.add_argument("--remote", action="store_true", help="use the real API instead of the local stand-in")
+    ap.add_argument("--seed", type=int, default=234)
+    args = ap.parse_args()
+
+    df = pd.read_csv(args.data).dropna(subset=["text"])
+    df = df.sample(n=min(args.n, len(df)), random_state=args.seed)
+    if args.remote:
+        clf = SentimentClassifier(api_key=load_api_key(), model=models[1], prompts=args.framing)
+    else:
+        # No quota to respect locally
+        ledger = RateLedger("local-stand-in", rpm=1e9, tpm=1e12)
+        clf = SentimentClassifier(model=models[1], prompts=args.framing, client=LocalBackend(args.framing), ledger=ledger)
+
+    # The stand-in agrees with itself by construction; only the real model's agreement means anything
+    report = compare_modes(clf, df["text"].tolist(), agreement=args.remote)
+    for key, value in report.items():
+        print(f"{key:>20}: {value}")
+    if not args.remote:
+        print("Agreement is not measured by the local stand-in; rerun with --remote")
@@ -3,6 +3,9 @@
 import re
 import time
 import csv
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin, urlparse
 from distro import name
 import requests
@@ -12,6 +15,11 @@ BASE = "https://utahsonlinelibrary.org/countynews/"
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (compatible; UtahCountyNewsScraper/1.0; +https://github.com/SamLeeBYU)"
 }
+# Every county page lives on the same host: at most PER_HOST requests in flight
+# there, each followed by a polite pause
+PER_HOST = 2
+POLITE_DELAY = 0.5
+_host_slots = defaultdict(lambda: threading.BoundedSemaphore(PER_HOST))
 
 def get_soup(url):
     for attempt in range(3):
@@ -107,23 +115,31 @@ def extract_news_links_from_county(county_url):
 
     return out
 
-def scrape_all():
+def _county_links(county_url):
+    with _host_slots[urlparse(county_url).netloc]:
+        try:
+            return extract_news_links_from_county(county_url)
+        except Exception:
+            return []
+        finally:
+            time.sleep(POLITE_DELAY)  # be polite
+
+def scrape_all(max_workers=PER_HOST):
     rows = []
     counties = discover_county_pages()
-    for county, county_url in counties:
-        try:
-            news_links = extract_news_links_from_county(county_url)
-        except Exception as e:
-            news_links = []
-        for city, name, url in news_links:
-            rows.append({
-                "county": county.split(".")[0].title().replace("_", " "),
-                "city": city,
-                "name": name,
-                "url": url,
-                "source_page": county_url
-            })
-        time.sleep(0.5)  # be polite
+    # County pages are independent; fetch them concurrently (within the per-host
+    # limit) but keep county order
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = pool.map(_county_links, [county_url for _, county_url in counties])
+        for (county, county_url), news_links in zip(counties, results):
+            for city, name, url in news_links:
+                rows.append({
+                    "county": county.split(".")[0].title().replace("_", " "),
+                    "city": city,
+                    "name": name,
+                    "url": url,
+                    "source_page": county_url
+                })
     return rows
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+# Sitemap / feed autodiscovery for the outlets in data/utah_news_sources.csv
+# For each outlet we check robots.txt "Sitemap:" lines, a handful of common
+# sitemap and news-sitemap paths, and RSS/Atom feeds (both <link rel="alternate">
+# in the homepage and common feed paths). Outlets are probed concurrently.
+# Saves a JSON keyed by outlet host: {host: {name, url, robots, sitemaps, feeds}}
+import csv
+import json
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+
+import requests
+from bs4 import BeautifulSoup
+from tqdm import tqdm
+
+from countynews import HEADERS
+
+COMMON_SITEMAP_PATHS = [
+    "/sitemap.xml",
+    "/sitemap_index.xml",
+    "/news-sitemap.xml",
+    "/sitemap-news.xml",
+    "/wp-sitemap.xml",
+    "/post-sitemap.xml",
+]
+
+COMMON_FEED_PATHS = ["/feed", "/rss", "/feed.xml", "/rss.xml", "/atom.xml"]
+
+FEED_TYPES = {"application/rss+xml", "application/atom+xml"}
+
+SITEMAP_RE = re.compile(r"^\s*sitemap:\s*(\S+)", re.I | re.M)
+
+
+def outlet_key(url):
+    # Host without "www.", used as the domain key in sitemaps.json
+    netloc = urlparse(url).netloc.lower()
+    return netloc[4:] if netloc.startswith("www.") else netloc
+
+
+def _get(url, timeout=10, max_bytes=64_000):
+    # Only the head of each document is needed to classify it
+    try:
+        with requests.get(url, headers=HEADERS, timeout=timeout, stream=True, allow_redirects=True) as resp:
+            if resp.status_code != 200:
+                return None
+            chunks, size = [], 0
+            for chunk in resp.iter_content(8192):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= max_bytes:
+                    break
+            return b"".join(chunks)
+    except requests.RequestException:
+        return None
+
+
+def classify_document(content):
+    # Returns "sitemap", "feed" or None from the first bytes of a response
+    if not content:
+        return None
+    if content[:2] == b"\x1f\x8b":
+        # .xml.gz sitemap; the download may be truncated, so decompress incrementally
+        try:
+            content = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(content, 4096)
+        except zlib.error:
+            return None
+    head = content[:4096].lower()
+    if b"<urlset" in head or b"<sitemapindex" in head:
+        return "sitemap"
+    if b"<rss" in head or b"<feed" in head or b"<rdf:rdf" in head:
+        return "feed"
+    return None
+
+
+def robots_sitemaps(base):
+    content = _get(urljoin(base, "/robots.txt"))
+    if not content:
+        return []
+    return SITEMAP_RE.findall(content.decode("utf-8", errors="replace"))
+
+
+def homepage_feeds(base):
+    content = _get(base, max_bytes=256_000)
+    if not content:
+        return []
+    soup = BeautifulSoup(content, "html.parser")
+    feeds = []
+    for link in soup.select("link[rel~=alternate][href]"):
+        if (link.get("type") or "").lower() in FEED_TYPES:
+            feeds.append(urljoin(base, link["href"]))
+    return feeds
+
+
+def discover_outlet(url):
+    parsed = urlparse(url)
+    base = f"{parsed.scheme or 'https'}://{parsed.netloc}/"
+
+    robots = robots_sitemaps(base)
+    sitemaps = [sm for sm in robots if classify_document(_get(sm)) == "sitemap"]
+    if not sitemaps:
+        for path in COMMON_SITEMAP_PATHS:
+            candidate = urljoin(base, path)
+            if classify_document(_get(candidate)) == "sitemap":
+                sitemaps.append(candidate)
+
+    feeds = homepage_feeds(base)
+    if not feeds:
+        for path in COMMON_FEED_PATHS:
+            candidate = urljoin(base, path)
+            if classify_document(_get(candidate)) == "feed":
+                feeds.append(candidate)
+                break
+
+    return {
+        "url": url,
+        "robots": robots,
+        "sitemaps": list(dict.fromkeys(sitemaps)),
+        "feeds": list(dict.fromkeys(feeds)),
+    }
+
+
+def discover_all(outlets, max_workers=16):
+    """
+    outlets: iterable of dicts with at least "url" (and optionally "name"),
+    e.g. rows from countynews.scrape_all or utah_news_sources.csv.
+    """
+    by_key = {}
+    for row in outlets:
+        by_key.setdefault(outlet_key(row["url"]), row)
+
+    found = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = pool.map(discover_outlet, [row["url"] for row in by_key.values()])
+        for (key, row), rec in tqdm(zip(by_key.items(), results), total=len(by_key), desc="Discovering outlets"):
+            rec["name"] = row.get("name")
+            found[key] = rec
+    return found
+
+
+if __name__ == "__main__":
+    with open("data/utah_news_sources.csv", newline="", encoding="utf-8") as f:
+        outlets = list(csv.DictReader(f))
+    found = discover_all(outlets)
+
+    out_path = "data/discovered_sitemaps.json"
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(found, f, indent=2, ensure_ascii=False)
+    n_sm = sum(1 for rec in found.values() if rec["sitemaps"])
+    n_feed = sum(1 for rec in found.values() if rec["feeds"])
+    print(f"{len(found)} outlets: {n_sm} with sitemaps, {n_feed} with feeds -> {out_path}")
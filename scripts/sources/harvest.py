@@ -2,11 +2,107 @@ import requests
 import xml.etree.ElementTree as ET
 from tqdm import tqdm
 import json
+import sys
+import zlib
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from urlnorm import dedupe_urls
+
+SM_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+NEWS_NS = "{http://www.google.com/schemas/sitemap-news/0.9}"
+RSS1_NS = "{http://purl.org/rss/1.0/}"
 
 class SitemapParser:
-    def __init__(self, domains):
+    def __init__(self, domains, discovered=None):
         self.domains = domains
+        # host -> {"sitemaps": [...], "feeds": [...]} from sources/discover.py
+        self.discovered = discovered or {}
         self.url_data = {}
+        # url -> <lastmod> (or news publication date) when the sitemap has one
+        self.lastmod = {}
+
+    @classmethod
+    def from_discovered(cls, filename="data/discovered_sitemaps.json", domains=None):
+        with open(filename, "r", encoding="utf-8") as f:
+            discovered = json.load(f)
+        if domains is None:
+            domains = [k for k, rec in discovered.items() if rec["sitemaps"] or rec["feeds"]]
+        return cls(domains, discovered=discovered)
+
+    def _locs(self, root):
+        # Page URLs from a <urlset>, remembering each entry's lastmod for delta crawls
+        urls = []
+        for entry in root.iter(f"{SM_NS}url"):
+            loc = entry.findtext(f"{SM_NS}loc")
+            if not loc:
+                continue
+            url = loc.strip()
+            stamp = entry.findtext(f"{SM_NS}lastmod") or entry.findtext(f".//{NEWS_NS}publication_date")
+            if stamp:
+                self.lastmod[url] = stamp.strip()
+            urls.append(url)
+        return urls
+
+    @staticmethod
+    def _parse_xml(content):
+        if content[:2] == b"\x1f\x8b":
+            content = zlib.decompress(content, 16 + zlib.MAX_WBITS)
+        return ET.fromstring(content)
+
+    def _harvest_sitemap(self, sm_url, max_depth=3):
+        # Follows <sitemapindex> children breadth-first; returns page URLs
+        urls, queue, seen = [], [(sm_url, 0)], set()
+        while queue:
+            url, depth = queue.pop(0)
+            if url in seen:
+                continue
+            seen.add(url)
+            try:
+                resp = requests.get(url, timeout=30)
+                if resp.status_code != 200:
+                    continue
+                root = self._parse_xml(resp.content)
+            except (requests.RequestException, ET.ParseError, zlib.error):
+                continue
+            if root.tag == f"{SM_NS}sitemapindex":
+                if depth < max_depth:
+                    queue.extend((loc.text.strip(), depth + 1) for loc in root.iter(f"{SM_NS}loc") if loc.text)
+            else:
+                urls.extend(self._locs(root))
+        return urls
+
+    def _harvest_feed(self, feed_url):
+        try:
+            resp = requests.get(feed_url, timeout=30)
+            if resp.status_code != 200:
+                return []
+            root = self._parse_xml(resp.content)
+        except (requests.RequestException, ET.ParseError, zlib.error):
+            return []
+        # RSS 2.0 <item><link>text</link>, RSS 1.0 (RDF) the same in its namespace, Atom
+        # <entry><link href=...>; the channel's and feed's own links point at the
+        # outlet homepage and are left out
+        urls = [link.text.strip() for ns in ("", RSS1_NS) for item in root.iter(f"{ns}item")
+                for link in item.findall(f"{ns}link") if link.text and link.text.strip()]
+        for entry in root.iter(f"{ATOM_NS}entry"):
+            links = entry.findall(f"{ATOM_NS}link")
+            # rel defaults to "alternate"; skip enclosures, replies, edit links
+            urls.extend(link.get("href") for link in links
+                        if link.get("href") and link.get("rel", "alternate") == "alternate")
+        return urls
+
+    def fetch_discovered(self, domain):
+        rec = self.discovered[domain]
+        urls = []
+        for sm_url in tqdm(rec["sitemaps"], desc=f"Fetching {domain}"):
+            urls.extend(self._harvest_sitemap(sm_url))
+        # Feeds only cover recent items; use them when there is no sitemap
+        if not urls:
+            for feed_url in rec["feeds"]:
+                urls.extend(self._harvest_feed(feed_url))
+        return urls
 
     @staticmethod
     def ksl_sitemap_urls():
@@ -34,35 +130,32 @@ class SitemapParser:
                 if resp.status_code != 200:
                     continue
                 root = ET.fromstring(resp.content)
-                urls.extend(
-                    loc.text.strip()
-                    for loc in root.iter(
-                        "{http://www.sitemaps.org/schemas/sitemap/0.9}loc"
-                    )
-                )
+                urls.extend(self._locs(root))
         elif domain in {"ksl", "ksl.com"}:
             for sm_url in tqdm(self.ksl_sitemap_urls(), desc=f"Fetching {domain}"):
                 resp = requests.get(sm_url)
                 if resp.status_code != 200:
                     continue
                 root = ET.fromstring(resp.content)
-                urls.extend(
-                    loc.text.strip()
-                    for loc in root.iter(
-                        "{http://www.sitemaps.org/schemas/sitemap/0.9}loc"
-                    )
-                )
+                urls.extend(self._locs(root))
+        elif domain in self.discovered:
+            urls = self.fetch_discovered(domain)
         return urls
 
     def parse(self):
         for domain in self.domains:
-            self.url_data[domain] = self.fetch_sitemap(domain)
+            # Sitemaps repeat articles under several URL forms; keep the first of each
+            self.url_data[domain] = dedupe_urls(self.fetch_sitemap(domain))
         return self.url_data
 
     def export_json(self, filename="data/sitemap_data.json"):
         with open(filename, "w", encoding="utf-8") as f:
             json.dump(self.url_data, f, indent=2, ensure_ascii=False)
 
+    def export_lastmod(self, filename="data/sitemap_lastmod.json"):
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(self.lastmod, f, ensure_ascii=False)
+
 # Example usage
 if __name__ == "__main__":
     parser = SitemapParser(["deseretnews", "ksl"])
@@ -72,3 +165,9 @@ if __name__ == "__main__":
     print(len(data["ksl"]))
     print(data["ksl"][:5])
     parser.export_json("data/sitemaps.json")
+    parser.export_lastmod("data/sitemap_lastmod.json")
+
+    # Every other outlet with a sitemap or feed found by sources/discover.py
+    # parser = SitemapParser.from_discovered("data/discovered_sitemaps.json")
+    # parser.parse()
+    # parser.export_json("data/sitemaps_discovered.json")
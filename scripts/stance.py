@@ -0,0 +1,41 @@
+import numpy as np
+
+LABELS = np.array(["A", "B", "C", "D"])
+STANCE_COLS = ["stanceA", "stanceB", "stanceC", "stanceD"]
+
+
+# Vectorized port of get.stance in stance-functions.R
+# X: n x 4 array of vote counts with columns A,B,C,D
+def get_stance(X) -> np.ndarray:
+    X = np.asarray(X)
+    if X.ndim != 2 or X.shape[1] != 4:
+        raise ValueError("X must be an n x 4 matrix of A,B,C,D counts")
+
+    # row max and ties at the max
+    t = X == X.max(axis=1, keepdims=True)
+    tA, tB, tC, tD = t.T
+    k = t.sum(axis=1)  # number of max ties per row
+
+    S = X.astype(np.int64, copy=True)  # adjusted scores (for tie-breaks only)
+
+    # Rule 1: C and D tied, plus at least one more tied -> choose D
+    S[tC & tD & (k >= 3), 3] += 1
+
+    # Rule 2: A and B tied -> choose C
+    S[tA & tB, 2] += 1
+
+    # Rule 3: A/B tied with C -> choose C
+    S[(tA & tC) | (tB & tC), 2] += 1
+
+    # Rule 4: A/B tied with D
+    # If the extra one is the other of A/B, choose C; otherwise choose D
+    r4a = tA & tD
+    S[r4a & tB, 2] += 1
+    S[r4a & ~tB, 3] += 1
+
+    r4b = tB & tD
+    S[r4b & tA, 2] += 1
+    S[r4b & ~tA, 3] += 1
+
+    # final stance by argmax after adjustments (first max, like max.col ties.method = "first")
+    return LABELS[S.argmax(axis=1)]
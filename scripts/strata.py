@@ -0,0 +1,70 @@
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# Python mirror of `stratify` in sample_allocation.R
+# Strata per site: 2017, 2018, 2019, 2020Q1-Q4, 2021Q1-Q4, 2022, 2023
+# Deseret News -> 1..13, ksl.com -> 14..26
+SITE_OFFSETS = {"Deseret News": 0, "ksl.com": 13}
+N_STRATA = 26
+
+NOTCOVID_STRATA = [1, 2, 3, 12, 13, 14, 15, 16, 25, 26]
+COVID_STRATA = [h for h in range(1, N_STRATA + 1) if h not in NOTCOVID_STRATA]
+
+# Date convention for published times: the local date and time as the site wrote
+# them. An offset is kept in the string but never applied, so a Mountain-time
+# evening article stays on its own day, quarter and stratum (as in the R frame).
+_TZ_SUFFIX = r"(?:Z|[+-]\d{2}:?\d{2})$"
+
+
+def normalize_timestamp(value) -> Optional[str]:
+    """ISO 8601 form of a published time ('2017-10-03', '2021-06-30T20:00:00-06:00',
+    '2017-01-10T22:57:22Z'), offset as written; strings that are not ISO 8601 are returned as is."""
+    value = str(value or "").strip()
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return value
+    if len(value) == 10:
+        return dt.date().isoformat()
+    out = dt.isoformat(timespec="seconds")
+    return out[:-6] + "Z" if out.endswith("+00:00") else out
+
+
+def parse_dates(values) -> pd.Series:
+    """Naive local timestamps from mixed ISO 8601 strings ('2017-10-03', '...T22:57:22Z',
+    '...T22:37:36.059Z', '...T12:00:00-06:00'). The offset is dropped rather than
+    applied, so the date is the one written in the string."""
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.tz_localize(None) if values.dt.tz is not None else values
+    stripped = values.astype("string").str.strip().str.replace(_TZ_SUFFIX, "", regex=True)
+    return pd.to_datetime(stripped, format="ISO8601", errors="coerce")
+
+
+def assign_strata(df: pd.DataFrame, date_col: str = "date", site_col: str = "site") -> pd.DataFrame:
+    """Adds year, quarter and strata columns (strata is NaN outside the design)."""
+    df = df.copy()
+    date = parse_dates(df[date_col])
+    df["year"] = date.dt.year
+    df["quarter"] = date.dt.quarter
+
+    y, q = df["year"], df["quarter"]
+    within = np.select(
+        [y <= 2017, y <= 2018, y <= 2019, y <= 2020, y <= 2021, y <= 2022, y <= 2023],
+        [1, 2, 3, 3 + q, 7 + q, 12, 13],
+        default=np.nan,
+    )
+    offset = df[site_col].map(SITE_OFFSETS)
+    df["strata"] = (within + offset).astype("Int64")
+    return df
+
+
+def stratum_of(site: str, date) -> int | None:
+    row = assign_strata(pd.DataFrame({"site": [site], "date": [date]}))
+    h = row["strata"].iat[0]
+    return None if pd.isna(h) else int(h)
@@ -0,0 +1,140 @@
+"""
+telemetry
+---------
+Per-call telemetry for LLM classification.
+
+SentimentClassifier records one CallRecord per generate_content call that
+returned text:
+    model, template   prompt template index (None for a shared multi-question call)
+    input_tokens, output_tokens
+                      from the response's usage_metadata, or estimated at ~4
+                      characters per token when the API reports none (estimated=True)
+    latency_sec       time spent in the successful API call
+    retries           failed attempts before it (429s and empty outputs)
+    backoff_sec       time spent waiting on the rate ledger and on 429 retry delays
+    parse_failures    labels extract_label / extract_labels could not read
+
+report() aggregates per run and per template; save() writes the raw calls as
+CSV and the summary as JSON; projection() scales the observed per-article
+tokens and time to a frame of N articles, with optional prices and the
+RPM/TPM quota the ledger enforces.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import List, Optional
+
+import pandas as pd
+
+from ratelimit import DEFAULT_RPM, DEFAULT_TPM
+
+
+@dataclass
+class CallRecord:
+    model: str
+    template: Optional[int]
+    input_tokens: int = 0
+    output_tokens: int = 0
+    estimated: bool = False
+    latency_sec: float = 0.0
+    retries: int = 0
+    backoff_sec: float = 0.0
+    parse_failures: int = 0
+    timestamp: float = field(default_factory=time.time)
+
+
+class Telemetry:
+    def __init__(self):
+        self.calls: List[CallRecord] = []
+        self.n_articles = 0
+        self.started = time.time()
+
+    def add(self, record: CallRecord):
+        self.calls.append(record)
+
+    def frame(self) -> pd.DataFrame:
+        df = pd.DataFrame([asdict(c) for c in self.calls], columns=list(CallRecord.__dataclass_fields__))
+        df["template"] = df["template"].map(lambda t: "shared" if pd.isna(t) else str(int(t)))
+        df["total_tokens"] = df["input_tokens"] + df["output_tokens"]
+        return df
+
+    @staticmethod
+    def _summarize(df: pd.DataFrame) -> dict:
+        return {
+            "calls": int(len(df)),
+            "input_tokens": int(df["input_tokens"].sum()),
+            "output_tokens": int(df["output_tokens"].sum()),
+            "estimated_share": float(df["estimated"].mean()) if len(df) else 0.0,
+            "mean_input_tokens": float(df["input_tokens"].mean()) if len(df) else 0.0,
+            "latency_sec": float(df["latency_sec"].sum()),
+            "latency_p50": float(df["latency_sec"].quantile(0.5)) if len(df) else 0.0,
+            "latency_p95": float(df["latency_sec"].quantile(0.95)) if len(df) else 0.0,
+            "retries": int(df["retries"].sum()),
+            "backoff_sec": float(df["backoff_sec"].sum()),
+            "parse_failures": int(df["parse_failures"].sum()),
+        }
+
+    def report(self) -> dict:
+        df = self.frame()
+        run = self._summarize(df)
+        run["articles"] = self.n_articles
+        run["wall_sec"] = time.time() - self.started
+        per_template = {t: self._summarize(g) for t, g in df.groupby("template", sort=True)}
+        return {"run": run, "per_template": per_template}
+
+    def projection(
+        self,
+        n_articles: int,
+        *,
+        usd_per_m_input: float = 0.0,
+        usd_per_m_output: float = 0.0,
+        rpm: float = DEFAULT_RPM,
+        tpm: float = DEFAULT_TPM,
+    ) -> dict:
+        """Scale this run's per-article averages to n_articles."""
+        if not self.n_articles:
+            raise ValueError("No articles classified yet")
+        df = self.frame()
+        scale = n_articles / self.n_articles
+        calls = len(df) * scale
+        tokens_in = float(df["input_tokens"].sum()) * scale
+        tokens_out = float(df["output_tokens"].sum()) * scale
+        return {
+            "articles": n_articles,
+            "calls": round(calls),
+            "input_tokens": round(tokens_in),
+            "output_tokens": round(tokens_out),
+            "usd": round((tokens_in * usd_per_m_input + tokens_out * usd_per_m_output) / 1e6, 2),
+            # At quota the slower of the two buckets sets the pace
+            "quota_hours": round(max(calls / rpm, (tokens_in + tokens_out) / tpm) / 60, 1),
+            "observed_rate_hours": round(float(df["latency_sec"].sum() + df["backoff_sec"].sum()) * scale / 3600, 1),
+        }
+
+    def save(self, path: str = "data/llm_telemetry", projection: Optional[dict] = None):
+        """Writes <path>_calls.csv and <path>_report.json."""
+        base = Path(path)
+        base.parent.mkdir(parents=True, exist_ok=True)
+        self.frame().to_csv(f"{base}_calls.csv", index=False)
+        report = self.report()
+        if projection is not None:
+            report["projection"] = projection
+        Path(f"{base}_report.json").write_text(json.dumps(report, indent=2))
+
+    def print_report(self):
+        report = self.report()
+        run = report["run"]
+        print(
+            f"{run['calls']} calls over {run['articles']} articles, "
+            f"{run['input_tokens']:,} in / {run['output_tokens']:,} out tokens "
+            f"({run['estimated_share']:.0%} estimated), {run['retries']} retries, "
+            f"{run['backoff_sec']:.0f}s backoff, {run['parse_failures']} parse failures"
+        )
+        table = pd.DataFrame(report["per_template"]).T[
+            ["calls", "mean_input_tokens", "output_tokens", "latency_p50", "latency_p95", "backoff_sec", "retries",
+             "parse_failures"]
+        ]
+        print(table.round(2).to_string())
@@ -0,0 +1,240 @@
+"""
+textstore
+---------
+Compressed store of every article the collector extracted, whether or not it
+passed the keyword filter, with an inverted term index. Widening the keyword
+list or the date range becomes an offline query instead of a recrawl.
+
+Layout (one directory):
+    texts.bin      append-only zlib-compressed JSON records
+                   (url, title, site, published_time, text), read through mmap
+    index.sqlite   docs:     doc_id -> canonical url, offset, length, site, published_time
+                   postings: term -> blocks of delta-encoded, compressed doc ids
+
+Terms are lowercase alphanumeric tokens. Postings are buffered in memory while
+collecting and written as one block per term on flush() (every few thousand
+documents, and on collector save()). A query intersects
+the postings of a keyword's tokens to find candidates ("herd immunity" ->
+herd AND immunity), then checks only those texts with the same regex the
+collector uses, so refilter() selects exactly what a recrawl with the new
+keywords would have accepted.
+
+Records are appended with O_APPEND and indexed in SQLite, so several collector
+processes (workqueue.py) can share one store.
+
+    python scripts/textstore.py --keywords booster mRNA "herd immunity" --out data/vaccine_articles_refilter.json
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import re
+import sqlite3
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+from urlnorm import canonicalize_url
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+FIELDS = ["url", "title", "site", "published_time", "text"]
+
+
+def tokenize(text: str) -> Set[str]:
+    return set(_TOKEN.findall(text.lower()))
+
+
+def keyword_pattern(keywords: Iterable[str]) -> re.Pattern:
+    # Same pattern VaccineArticleCollector builds for _has_keywords
+    return re.compile(r"\b(" + "|".join(map(re.escape, keywords)) + r")\b", re.IGNORECASE)
+
+
+def _encode_postings(doc_ids: Iterable[int]) -> bytes:
+    ids = np.unique(np.fromiter(doc_ids, dtype=np.uint32))
+    return zlib.compress(np.diff(ids, prepend=np.uint32(0)).astype(np.uint32).tobytes())
+
+
+def _decode_postings(block: bytes) -> np.ndarray:
+    return np.cumsum(np.frombuffer(zlib.decompress(block), dtype=np.uint32), dtype=np.uint32)
+
+
+class TextStore:
+    def __init__(self, path: str = "data/textstore", flush_every: int = 2000):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.bin_path = self.path / "texts.bin"
+        self.fd = os.open(self.bin_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        self._mm: Optional[mmap.mmap] = None
+
+        self.conn = sqlite3.connect(str(self.path / "index.sqlite"), timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                doc_id INTEGER PRIMARY KEY,
+                url TEXT UNIQUE NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                site TEXT,
+                published_time TEXT
+            );
+            CREATE INDEX IF NOT EXISTS docs_time ON docs (published_time);
+            CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, block BLOB NOT NULL);
+            CREATE INDEX IF NOT EXISTS postings_term ON postings (term);
+            """
+        )
+        # term -> doc ids added since the last flush; flushed every `flush_every` docs
+        # so a long crawl does not hold the whole index in memory
+        self._pending: Dict[str, List[int]] = defaultdict(list)
+        self._n_pending = 0
+        self.flush_every = flush_every
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def __contains__(self, url: str) -> bool:
+        return self.conn.execute(
+            "SELECT 1 FROM docs WHERE url = ?", (canonicalize_url(url),)
+        ).fetchone() is not None
+
+    def add(self, rec: Dict[str, str]) -> int:
+        """Append one extracted article; a URL stored before is replaced. Returns its doc id."""
+        data = zlib.compress(json.dumps({k: rec.get(k) for k in FIELDS}, ensure_ascii=False).encode("utf-8"))
+        os.write(self.fd, data)
+        # With O_APPEND our fd offset is the end of our own write, even if others appended meanwhile
+        offset = os.lseek(self.fd, 0, os.SEEK_CUR) - len(data)
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO docs (url, offset, length, site, published_time) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (url) DO UPDATE SET offset = excluded.offset, length = excluded.length, "
+                "site = excluded.site, published_time = excluded.published_time RETURNING doc_id",
+                (canonicalize_url(rec["url"]), offset, len(data), rec.get("site"), rec.get("published_time") or ""),
+            )
+            doc_id = cur.fetchone()[0]
+        for term in tokenize(f"{rec.get('title') or ''} {rec.get('text') or ''}"):
+            self._pending[term].append(doc_id)
+        self._n_pending += 1
+        if self._n_pending >= self.flush_every:
+            self.flush()
+        return doc_id
+
+    def flush(self):
+        if not self._pending:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO postings (term, block) VALUES (?, ?)",
+                ((term, _encode_postings(ids)) for term, ids in self._pending.items()),
+            )
+        self._pending.clear()
+        self._n_pending = 0
+
+    def compact_postings(self):
+        """Merge each term's per-flush blocks into one (optional; speeds up queries)."""
+        self.flush()
+        terms = [r[0] for r in self.conn.execute("SELECT DISTINCT term FROM postings")]
+        with self.conn:
+            for term in terms:
+                ids = self.postings(term)
+                self.conn.execute("DELETE FROM postings WHERE term = ?", (term,))
+                self.conn.execute("INSERT INTO postings (term, block) VALUES (?, ?)", (term, _encode_postings(ids)))
+        self.conn.execute("VACUUM")
+
+    def postings(self, term: str) -> np.ndarray:
+        blocks = [_decode_postings(b) for (b,) in self.conn.execute("SELECT block FROM postings WHERE term = ?", (term,))]
+        pending = self._pending.get(term)
+        if pending:
+            blocks.append(np.asarray(pending, dtype=np.uint32))
+        return np.unique(np.concatenate(blocks)) if blocks else np.empty(0, dtype=np.uint32)
+
+    def _read(self, offset: int, length: int) -> Dict[str, str]:
+        if self._mm is None or offset + length > len(self._mm):
+            # Map (again) once the file has grown past the current mapping
+            if self._mm is not None:
+                self._mm.close()
+            self._mm = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+        return json.loads(zlib.decompress(self._mm[offset:offset + length]))
+
+    def get(self, url: str) -> Optional[Dict[str, str]]:
+        row = self.conn.execute("SELECT offset, length FROM docs WHERE url = ?", (canonicalize_url(url),)).fetchone()
+        return self._read(*row) if row else None
+
+    def candidates(self, keywords: Iterable[str]) -> np.ndarray:
+        """Doc ids that contain every token of at least one keyword."""
+        out = []
+        for kw in keywords:
+            tokens = sorted(tokenize(kw))
+            if not tokens:
+                continue
+            ids = self.postings(tokens[0])
+            for token in tokens[1:]:
+                ids = np.intersect1d(ids, self.postings(token), assume_unique=True)
+            out.append(ids)
+        return np.unique(np.concatenate(out)) if out else np.empty(0, dtype=np.uint32)
+
+    def iter_docs(self, doc_ids: Optional[np.ndarray] = None, start_date: Optional[str] = None,
+                  end_date: Optional[str] = None) -> Iterator[Dict[str, str]]:
+        sql, params = "SELECT offset, length FROM docs WHERE published_time != ''", []
+        if start_date:
+            sql, params = sql + " AND substr(published_time, 1, 10) >= ?", params + [start_date]
+        if end_date:
+            sql, params = sql + " AND substr(published_time, 1, 10) <= ?", params + [end_date]
+        if doc_ids is None:
+            rows = self.conn.execute(sql, params).fetchall()
+        else:
+            rows = []
+            ids = doc_ids.tolist()
+            for i in range(0, len(ids), 900):  # SQLite's bound-parameter limit
+                chunk = ids[i:i + 900]
+                rows += self.conn.execute(
+                    f"{sql} AND doc_id IN ({','.join('?' * len(chunk))})", params + chunk
+                ).fetchall()
+        # File order keeps the mmap reads sequential
+        for offset, length in sorted(rows):
+            yield self._read(offset, length)
+
+    def refilter(self, keywords: Iterable[str], start_date: Optional[str] = None,
+                 end_date: Optional[str] = None) -> Dict[str, Dict[str, str]]:
+        """Articles a collector with these keywords and dates would keep, as {url: record} (collector JSON)."""
+        keywords = list(keywords)
+        pattern = keyword_pattern(keywords)
+        out = {}
+        for rec in self.iter_docs(self.candidates(keywords), start_date, end_date):
+            if rec.get("text") and pattern.search(rec["text"]):
+                out[rec["url"]] = rec
+        return out
+
+    def close(self):
+        self.flush()
+        if self._mm is not None:
+            self._mm.close()
+        os.close(self.fd)
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from sample_frame import DEFAULT_KEY_WORDS
+
+    ap = argparse.ArgumentParser(description="Offline keyword / date re-filter over the text store")
+    ap.add_argument("--store", default="data/textstore")
+    ap.add_argument("--keywords", nargs="*", default=[], help="added to DEFAULT_KEY_WORDS")
+    ap.add_argument("--only", action="store_true", help="use --keywords instead of DEFAULT_KEY_WORDS + --keywords")
+    ap.add_argument("--start-date", default="2017-01-01")
+    ap.add_argument("--end-date", default="2024-01-01")
+    ap.add_argument("--out", default="data/vaccine_articles_refilter.json")
+    args = ap.parse_args()
+
+    store = TextStore(args.store)
+    keywords = args.keywords if args.only else DEFAULT_KEY_WORDS + args.keywords
+    found = store.refilter(keywords, args.start_date, args.end_date)
+    Path(args.out).write_text(json.dumps(found, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"{len(found)} of {len(store)} stored articles match -> {args.out}")
+    print(pd.Series([rec["site"] for rec in found.values()]).value_counts().to_string())
@@ -0,0 +1,164 @@
+"""
+urlnorm
+-------
+Canonical URL form used as the identity of an article across harvest,
+collection and frame building, plus a persistent store of every URL the
+collector has ever decided on.
+
+canonicalize_url() maps the variants we see for one article to one key:
+http/https, www/bare host, trailing slashes, fragments, tracking parameters
+(utm_*, fbclid, ...) and AMP variants (/amp, ?amp=1, amp. hosts, outputType=amp).
+The key is for identity only; pages are still fetched from their original URL.
+
+SeenURLs keeps canonical URL -> sitemap lastmod in SQLite with a Bloom filter
+in front of it, so the common "never seen" answer costs a few hash probes and
+no disk read. It supports the small mapping interface the collector uses for
+its decided-URL ledger (in / [] / []=).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import re
+import sqlite3
+import struct
+from pathlib import Path
+from typing import Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_gl",
+    "cmpid", "ocid", "ref", "ref_src", "sr_share", "taid", "igshid", "share",
+}
+AMP_PARAMS = {"amp", "outputtype", "output"}
+_AMP_PATH = re.compile(r"/amp/?$|/amp\.html$", re.I)
+
+
+def canonicalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    for prefix in ("www.", "amp."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+
+    path = re.sub(r"/{2,}", "/", parts.path or "/")
+    path = _AMP_PATH.sub("", path)
+    path = path.rstrip("/") or "/"
+
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_")
+        and k.lower() not in TRACKING_PARAMS
+        and not (k.lower() in AMP_PARAMS and v.lower() in ("", "1", "amp", "true"))
+    ]
+    return urlunsplit(("https", host, path, urlencode(sorted(query)), ""))
+
+
+def dedupe_urls(urls: Iterable[str]) -> list[str]:
+    # First-seen original form of each canonical URL, order preserved
+    seen, out = set(), []
+    for url in urls:
+        key = canonicalize_url(url)
+        if key not in seen:
+            seen.add(key)
+            out.append(url)
+    return out
+
+
+class BloomFilter:
+    _HEADER = struct.Struct("<QQQ")  # n_bits, n_hashes, n_items
+
+    def __init__(self, capacity: int = 2_000_000, error_rate: float = 0.01):
+        self.n_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.n_hashes = max(1, round(self.n_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.n_bits + 7) // 8)
+        self.n_items = 0
+        self.capacity = capacity
+
+    def _positions(self, item: str):
+        # Double hashing (Kirsch-Mitzenmacher) from one 128-bit digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        for i in range(self.n_hashes):
+            yield (h1 + i * h2) % self.n_bits
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.n_items += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def save(self, path: Path):
+        with open(path, "wb") as f:
+            f.write(self._HEADER.pack(self.n_bits, self.n_hashes, self.n_items))
+            f.write(self.bits)
+
+    @classmethod
+    def load(cls, path: Path) -> "BloomFilter":
+        data = Path(path).read_bytes()
+        n_bits, n_hashes, n_items = cls._HEADER.unpack_from(data)
+        bf = cls.__new__(cls)
+        bf.n_bits, bf.n_hashes, bf.n_items = n_bits, n_hashes, n_items
+        bf.bits = bytearray(data[cls._HEADER.size:])
+        bf.capacity = int(n_bits * math.log(2) / n_hashes)
+        return bf
+
+
+class SeenURLs:
+    def __init__(self, path: str = "data/seen_urls.sqlite", capacity: int = 2_000_000):
+        self.path = Path(path)
+        self.bloom_path = self.path.with_suffix(".bloom")
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seen (url TEXT PRIMARY KEY, lastmod TEXT NOT NULL DEFAULT '')")
+        n = self.conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+        bloom = BloomFilter.load(self.bloom_path) if self.bloom_path.exists() else None
+        if bloom is None or bloom.n_items != n or n > bloom.capacity:
+            # Missing, stale (crash before save) or full: rebuild from the exact store
+            bloom = BloomFilter(capacity=max(capacity, 2 * n))
+            for (url,) in self.conn.execute("SELECT url FROM seen"):
+                bloom.add(url)
+        self.bloom = bloom
+
+    def __contains__(self, url: str) -> bool:
+        key = canonicalize_url(url)
+        if key not in self.bloom:
+            return False
+        return self.conn.execute("SELECT 1 FROM seen WHERE url = ?", (key,)).fetchone() is not None
+
+    def __getitem__(self, url: str) -> str:
+        row = self.conn.execute("SELECT lastmod FROM seen WHERE url = ?", (canonicalize_url(url),)).fetchone()
+        if row is None:
+            raise KeyError(url)
+        return row[0]
+
+    def get(self, url: str, default: Optional[str] = None) -> Optional[str]:
+        try:
+            return self[url]
+        except KeyError:
+            return default
+
+    def __setitem__(self, url: str, lastmod: str):
+        key = canonicalize_url(url)
+        existed = key in self.bloom and self.conn.execute(
+            "SELECT 1 FROM seen WHERE url = ?", (key,)
+        ).fetchone() is not None
+        self.conn.execute(
+            "INSERT INTO seen (url, lastmod) VALUES (?, ?) ON CONFLICT (url) DO UPDATE SET lastmod = excluded.lastmod",
+            (key, lastmod or ""),
+        )
+        if not existed:
+            # Keeps bloom.n_items equal to the row count, which is how a stale filter is detected
+            self.bloom.add(key)
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+    def flush(self):
+        self.conn.commit()
+        self.bloom.save(self.bloom_path)
@@ -0,0 +1,244 @@
+"""
+workqueue
+---------
+Durable, lease-based work queue of URLs for running several collector workers
+at once (on one box, or on several sharing the queue backend).
+
+Workers claim a batch of URLs under a lease, heartbeat while they work, and
+commit one result per URL. A worker that dies simply stops heartbeating; its
+lease expires and the URLs go back to the queue. URLs whose page could not be
+fetched are retried up to `max_attempts` times and are never marked as decided.
+
+WorkQueue is the backend interface; SQLiteWorkQueue is the local file-backed
+implementation. SQLite is safe for many processes on one host; for workers on
+several machines put the file on a local disk of one host and use a different
+backend (anything implementing WorkQueue) rather than SQLite over NFS.
+
+Usage:
+    python scripts/workqueue.py init  --queue data/crawl.sqlite --json-in data/sitemaps.json
+    python scripts/workqueue.py work  --queue data/crawl.sqlite --worker box1-a   (x N)
+    python scripts/workqueue.py merge --queue data/crawl.sqlite --json-out data/vaccine_articles.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+class WorkQueue(ABC):
+    @abstractmethod
+    def enqueue(self, items: Iterable[Tuple[str, str]]) -> int:
+        """Add (url, domain) pairs; URLs already queued are ignored. Returns number added."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim(self, worker: str, n: int, lease_sec: float) -> List[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def heartbeat(self, worker: str, lease_sec: float) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def complete(self, url: str, worker: str, result: Optional[Dict[str, Any]]) -> None:
+        """Commit a URL; result is the article record, or None if it was rejected."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def fail(self, url: str, worker: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def results(self) -> Dict[str, Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def done_urls(self) -> List[str]:
+        """Every committed URL, accepted or rejected."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+
+class SQLiteWorkQueue(WorkQueue):
+    def __init__(self, path: str, max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        # isolation_level=None: we issue BEGIN IMMEDIATE ourselves so that
+        # claim() takes the write lock before reading pending rows
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT UNIQUE NOT NULL,
+                domain TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, seq)")
+
+    def _tx(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    def enqueue(self, items):
+        self._tx()
+        try:
+            before = self.conn.total_changes
+            self.conn.executemany("INSERT OR IGNORE INTO tasks (url, domain) VALUES (?, ?)", list(items))
+            added = self.conn.total_changes - before
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def claim(self, worker, n, lease_sec):
+        now = time.time()
+        self._tx()
+        try:
+            # Expired leases go back to the queue (the worker died or stalled)
+            self.conn.execute(
+                "UPDATE tasks SET status = 'pending', worker = NULL WHERE status = 'leased' AND lease_until < ?",
+                (now,),
+            )
+            rows = self.conn.execute(
+                "SELECT url FROM tasks WHERE status = 'pending' ORDER BY seq LIMIT ?", (n,)
+            ).fetchall()
+            urls = [r[0] for r in rows]
+            self.conn.executemany(
+                "UPDATE tasks SET status = 'leased', worker = ?, lease_until = ? WHERE url = ?",
+                [(worker, now + lease_sec, url) for url in urls],
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return urls
+
+    def heartbeat(self, worker, lease_sec):
+        self.conn.execute(
+            "UPDATE tasks SET lease_until = ? WHERE status = 'leased' AND worker = ?",
+            (time.time() + lease_sec, worker),
+        )
+
+    def complete(self, url, worker, result):
+        # A slow worker whose lease expired may still finish first; the result is the same
+        self.conn.execute(
+            "UPDATE tasks SET status = 'done', worker = ?, lease_until = NULL, result = ? "
+            "WHERE url = ? AND status != 'done'",
+            (worker, json.dumps(result, ensure_ascii=False) if result is not None else None, url),
+        )
+
+    def fail(self, url, worker):
+        self.conn.execute(
+            "UPDATE tasks SET attempts = attempts + 1, worker = NULL, lease_until = NULL, "
+            "status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END "
+            "WHERE url = ? AND worker = ? AND status = 'leased'",
+            (self.max_attempts, url, worker),
+        )
+
+    def results(self):
+        rows = self.conn.execute(
+            "SELECT url, result FROM tasks WHERE status = 'done' AND result IS NOT NULL ORDER BY seq"
+        )
+        return {url: json.loads(result) for url, result in rows}
+
+    def done_urls(self):
+        return [r[0] for r in self.conn.execute("SELECT url FROM tasks WHERE status = 'done' ORDER BY seq")]
+
+    def stats(self):
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status")
+        return dict(rows.fetchall())
+
+
+def run_worker(collector, queue: WorkQueue, worker: str, batch_size: int = 25, lease_sec: float = 300):
+    """Claim batches until the queue is drained, committing one decision per URL."""
+    n_done = 0
+    while True:
+        urls = queue.claim(worker, batch_size, lease_sec)
+        if not urls:
+            break
+        for url in urls:
+            try:
+                rec = collector.decide(url)
+            except Exception:
+                # Fetch failures (extract.FetchError) and crashes go back to the queue
+                # until max_attempts; a fetched page is committed accepted or rejected
+                queue.fail(url, worker)
+            else:
+                queue.complete(url, worker, rec)
+                n_done += 1
+            queue.heartbeat(worker, lease_sec)
+            if collector.sleep_sec:
+                time.sleep(collector.sleep_sec)
+    if collector.text_store is not None:
+        collector.text_store.flush()
+    return n_done
+
+
+if __name__ == "__main__":
+    from sample_frame import VaccineArticleCollector
+
+    ap = argparse.ArgumentParser(description="Sharded crawl over a shared work queue")
+    ap.add_argument("command", choices=["init", "work", "merge", "stats"])
+    ap.add_argument("--queue", default="data/crawl_queue.sqlite")
+    ap.add_argument("--json-in", default="data/sitemaps.json")
+    ap.add_argument("--json-out", default="data/vaccine_articles.json")
+    ap.add_argument("--domains", nargs="*")
+    ap.add_argument("--worker", default=f"{socket.gethostname()}-{os.getpid()}")
+    ap.add_argument("--batch-size", type=int, default=25)
+    ap.add_argument("--lease-sec", type=float, default=300)
+    ap.add_argument("--start-date", default="2017-01-01")
+    ap.add_argument("--end-date", default="2024-01-01")
+    ap.add_argument("--decided", default="data/seen_urls.sqlite", help="seen-URL store, updated on merge")
+    ap.add_argument("--text-store", default="data/textstore", help="keep every extracted article ('' to disable)")
+    ap.add_argument("--cube", default="data/stance_cube.sqlite", help="monthly aggregates updated on merge ('' to disable)")
+    args = ap.parse_args()
+
+    queue = SQLiteWorkQueue(args.queue)
+    text_store = None
+    if args.text_store and args.command == "work":
+        from textstore import TextStore
+        text_store = TextStore(args.text_store)
+    cube = None
+    if args.cube and args.command == "merge":
+        from cube import StanceCube
+        cube = StanceCube(args.cube)
+    collector = VaccineArticleCollector(
+        json_in=args.json_in,
+        json_out=args.json_out,
+        start_date=args.start_date,
+        end_date=args.end_date,
+        decided_path=args.decided,
+        text_store=text_store,
+        cube=cube,
+    )
+
+    if args.command == "init":
+        added = collector.enqueue(queue, domains=args.domains)
+        print(f"Queued {added} URLs")
+    elif args.command == "work":
+        n = run_worker(collector, queue, args.worker, batch_size=args.batch_size, lease_sec=args.lease_sec)
+        print(f"{args.worker}: processed {n} URLs")
+    elif args.command == "merge":
+        collector.merge_queue(queue)
+        collector.save()
+        print(f"Wrote {len(collector._results)} articles to {args.json_out}")
+        print(f"Affected strata: {collector.affected_strata()}")
+    print(queue.stats())